@@ -1,13 +1,116 @@
-from dotenv import load_dotenv
 import os
 from pathlib import Path
 
-load_dotenv()
+# Serverless mode: Vercel sets VERCEL=1; can also be forced with SERVERLESS=true
+SERVERLESS = bool(os.getenv("VERCEL")) or os.getenv("SERVERLESS", "false").lower() == "true"
+
+# Deployed functions get their settings from the platform, so skip the .env lookup there
+if not SERVERLESS:
+    from dotenv import load_dotenv
+    load_dotenv()
+
+MONGODB_URL = os.getenv("MONGODB_URL")
+DB_NAME = os.getenv("DB_NAME")
+
+def _optional_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+# MongoDB connection pool and timeout settings (unset values use driver defaults)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = _optional_int("MONGO_MAX_IDLE_TIME_MS")
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+MONGO_SOCKET_TIMEOUT_MS = _optional_int("MONGO_SOCKET_TIMEOUT_MS")
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 20000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+# Comma separated, e.g. "zstd,snappy,zlib"
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
+HEALTH_CHECK_TIMEOUT_MS = int(os.getenv("HEALTH_CHECK_TIMEOUT_MS", 1000))
+# After SIGTERM, readiness fails for this long before the server stops accepting connections,
+# so load balancers can take the instance out first; keep it under the orchestrator's kill timeout
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", 5))
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 14))
+# How stale another worker's view of logged-out tokens may be
+REVOCATION_SYNC_SECONDS = int(os.getenv("REVOCATION_SYNC_SECONDS", 30))
 
-# File upload settings
+# File upload settings (the directory is created on first upload)
 UPLOAD_DIRECTORY = Path("uploads")
-UPLOAD_DIRECTORY.mkdir(exist_ok=True)
\ No newline at end of file
+
+# Authenticated user cache settings
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+# Password hashing settings
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+# Checkout settings (transactions need a replica set, e.g. MongoDB Atlas)
+CHECKOUT_USE_TRANSACTIONS = os.getenv("CHECKOUT_USE_TRANSACTIONS", "false").lower() == "true"
+
+# Admin order listing/export settings
+ADMIN_ORDERS_PAGE_SIZE = int(os.getenv("ADMIN_ORDERS_PAGE_SIZE", 50))
+ORDER_EXPORT_BATCH_SIZE = int(os.getenv("ORDER_EXPORT_BATCH_SIZE", 500))
+
+# Bulk product import/update settings
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 1000))
+BULK_MAX_REPORTED_ERRORS = int(os.getenv("BULK_MAX_REPORTED_ERRORS", 1000))
+
+# Upload pipeline settings
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", 10))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# 0 resizes images in the thread pool instead of a process pool (e.g. on serverless)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+IMAGE_VARIANTS = {
+    "thumbnail": int(os.getenv("IMAGE_THUMBNAIL_SIZE", 200)),
+    "medium": int(os.getenv("IMAGE_MEDIUM_SIZE", 800)),
+}
+
+# Product catalog cache settings
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", 5000))
+PRODUCT_CACHE_MAX_MB = int(os.getenv("PRODUCT_CACHE_MAX_MB", 64))
+PRODUCT_CACHE_TTL_SECONDS = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", 300))
+# Change streams need a replica set; without them a worker sees other workers' writes only after the unwatched TTL
+PRODUCT_CACHE_WATCH = os.getenv("PRODUCT_CACHE_WATCH", "true").lower() == "true"
+# TTL used while no change stream is open (serverless, no replica set, reconnecting)
+PRODUCT_CACHE_UNWATCHED_TTL_SECONDS = int(os.getenv("PRODUCT_CACHE_UNWATCHED_TTL_SECONDS", 5))
+
+# Hot-product reservations: how long add-to-cart holds stock, and how often
+# expired holds are returned and shard totals are written back to products
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", 900))
+INVENTORY_SWEEP_SECONDS = int(os.getenv("INVENTORY_SWEEP_SECONDS", 30))
+
+# Idempotency-Key settings: how long results replay, how long a claim blocks
+# duplicates before another worker may take it over, and how long a duplicate waits
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 30))
+IDEMPOTENCY_WAIT_SECONDS = int(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 10))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+
+# Outbox worker settings for post-order side effects
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 1))
+# An event not finished within its lease is handed to another worker
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 60))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 2))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 600))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", 72))
+
+# Cart retention: abandoned carts are deleted after CART_RETENTION_DAYS, empty ones sooner
+CART_RETENTION_DAYS = int(os.getenv("CART_RETENTION_DAYS", 30))
+CART_EMPTY_RETENTION_HOURS = int(os.getenv("CART_EMPTY_RETENTION_HOURS", 24))
+CART_SWEEP_INTERVAL_MINUTES = int(os.getenv("CART_SWEEP_INTERVAL_MINUTES", 60))
+CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", 1000))
+
+# Serialize trusted DB documents with pre-built TypeAdapters instead of re-validating them
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "false").lower() == "true"
+
+# Cold-start budget checked by `python -m app.profile_startup`
+COLD_START_BUDGET_MS = int(os.getenv("COLD_START_BUDGET_MS", 1500))
@@ -29,38 +29,91 @@
 # chat gpt code
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING, TEXT
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-MONGODB_URL = os.getenv("MONGODB_URL")
-DB_NAME = os.getenv("DB_NAME")
+from app.config import (
+    MONGODB_URL, DB_NAME, SERVERLESS,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_COMPRESSORS
+)
+from app.indexes import ensure_indexes
+from app.utils.metrics import mongo_command_listener, mongo_pool_listener
+
+def client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [mongo_command_listener, mongo_pool_listener],
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return {key: value for key, value in options.items() if value is not None}
 
 class Database:
-    client = None
-    db = None
+    """Holds the Motor client, created lazily on first use and reused afterwards"""
+
+    def __init__(self):
+        self._client = None
+        self._db = None
+
+    def _connect(self):
+        # Constructing the client doesn't touch the network; it connects on first operation
+        self._client = AsyncIOMotorClient(MONGODB_URL, **client_options())
+        self._db = self._client[DB_NAME]
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._connect()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._connect()
+        return self._db
+
+    @db.setter
+    def db(self, value):
+        self._db = value
+
+    def close(self) -> bool:
+        if self._client is None:
+            return False
+        self._client.close()
+        self._client = None
+        self._db = None
+        return True
 
 db = Database()
 
-async def connect_to_mongo():
-    try:
-        db.client = AsyncIOMotorClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
-        db.db = db.client[DB_NAME]
+async def connect_to_mongo(create_indexes: bool = True):
+    # Serverless invocations connect on first query; indexes are managed out of band
+    # with `python -m app.indexes` so cold starts don't wait on the server
+    if SERVERLESS:
+        return
 
+    try:
         # Force a connection check
         await db.client.server_info()
 
-        # Create indexes (runs once on startup)
-        await db.db.products.create_index([("name", TEXT), ("category", TEXT)])
-        await db.db.users.create_index([("email", ASCENDING)], unique=True)
+        # Reconcile the index registry (runs once on startup)
+        if create_indexes:
+            await ensure_indexes(db.db)
 
         print("✅ Connected to MongoDB Atlas")
     except Exception as e:
+        # Fail startup rather than serving requests that will all error later
         print("❌ MongoDB connection error:", e)
+        raise
 
 async def close_mongo_connection():
-    if db.client:
-        db.client.close()
+    if db.close():
         print("🔌 MongoDB connection closed")
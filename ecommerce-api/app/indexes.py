@@ -0,0 +1,177 @@
+"""Index registry: every index the routes' queries rely on, declared in one place.
+
+Run `python -m app.indexes` to reconcile indexes against a database and
+`python -m app.indexes --check` to explain each known query shape and fail
+if any of them would run as a collection scan.
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from app.config import OUTBOX_RETENTION_HOURS
+from datetime import datetime
+from typing import Dict, List, Tuple
+import argparse
+import asyncio
+import sys
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "products": [
+        # products.get_products search
+        IndexModel([("name", TEXT), ("category", TEXT)]),
+        # products.get_products listing and keyset pagination
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "users": [
+        # auth.login, auth.signup and get_current_user
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "carts": [
+        # Every cart route and checkout; one cart per user
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        # cart_sweeper.sweep_carts
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "orders": [
+        # orders.get_orders and orders.get_order
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        # admin.get_all_orders and admin.export_orders
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        # outbox.relay; only orders with events still to move are indexed
+        IndexModel([("pending_events._id", ASCENDING)], sparse=True),
+    ],
+    "revoked_tokens": [
+        # Entries expire with the tokens they revoke
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        # revocation.sync_revocations
+        IndexModel([("revoked_at", ASCENDING)]),
+    ],
+    "stock_shards": [
+        # inventory._take fallback, reconcile_stock and unsharding
+        IndexModel([("product_id", ASCENDING), ("available", DESCENDING)]),
+    ],
+    "reservations": [
+        # inventory.consume and inventory.release
+        IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)]),
+        # inventory.sweep_expired; not a TTL index, since expired holds must return their stock
+        IndexModel([("expires_at", ASCENDING)]),
+        # inventory._take releasing one product's expired holds before reporting it sold out
+        IndexModel([("product_id", ASCENDING), ("expires_at", ASCENDING)]),
+    ],
+    "idempotency_keys": [
+        # Stored results expire after IDEMPOTENCY_TTL_HOURS
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "outbox": [
+        # outbox._claim_batch and outbox_stats
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)]),
+        # Finished events are kept for OUTBOX_RETENTION_HOURS for inspection
+        IndexModel([("completed_at", ASCENDING)], expireAfterSeconds=OUTBOX_RETENTION_HOURS * 3600),
+    ],
+    "product_sales": [
+        # admin.get_top_products
+        IndexModel([("units", DESCENDING)]),
+        IndexModel([("revenue", DESCENDING)]),
+    ],
+}
+
+# Representative (filter, sort) shapes issued by the routes, used by --check
+_SAMPLE_DATE = datetime(2024, 1, 1)
+
+QUERY_SHAPES: List[Tuple[str, str, Dict, List]] = [
+    ("products.get_products", "products", {}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("products.get_products?category", "products", {"category": "sample"},
+     [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("products.get_products?cursor", "products",
+     {"$or": [{"created_at": {"$lt": _SAMPLE_DATE}}, {"created_at": _SAMPLE_DATE, "_id": {"$lt": "x"}}]},
+     [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("products.get_products?search", "products", {"$text": {"$search": "sample"}}, []),
+    ("auth_utils.get_current_user", "users", {"email": "sample@example.com"}, []),
+    ("cart.get_cart", "carts", {"user_id": "sample"}, []),
+    ("cart_sweeper.sweep_carts", "carts", {"updated_at": {"$lt": _SAMPLE_DATE}}, []),
+    ("orders.get_orders", "orders", {"user_id": "sample"}, [("created_at", DESCENDING)]),
+    ("orders.get_order", "orders", {"_id": "sample", "user_id": "sample"}, []),
+    ("admin.get_all_orders", "orders", {}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("admin.get_all_orders?status", "orders", {"status": "pending"},
+     [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("revocation.sync_revocations", "revoked_tokens", {"revoked_at": {"$gt": _SAMPLE_DATE}}, [("revoked_at", ASCENDING)]),
+    ("inventory.consume", "reservations", {"user_id": "sample", "product_id": "sample"}, []),
+    ("inventory.sweep_expired", "reservations", {"expires_at": {"$lte": _SAMPLE_DATE}}, []),
+    ("inventory.sweep_expired?product", "reservations", {"expires_at": {"$lte": _SAMPLE_DATE}, "product_id": "sample"}, []),
+    ("outbox._claim_batch", "outbox", {"status": {"$in": ["pending", "processing"]}, "available_at": {"$lte": _SAMPLE_DATE}},
+     [("available_at", ASCENDING)]),
+    ("outbox.relay", "orders", {"pending_events._id": {"$exists": True}}, []),
+    ("outbox._claim_batch?lease", "outbox", {"_id": {"$in": ["sample"]}, "lease": "sample"}, []),
+    ("admin.get_sales_stats", "sales_daily", {"_id": {"$gte": "2024-01-01"}}, [("_id", ASCENDING)]),
+    ("admin.get_top_products", "product_sales", {}, [("units", DESCENDING)]),
+]
+
+async def ensure_indexes(database, drop_extra: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """Create missing registry indexes and report (or drop) undeclared ones"""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = database[collection_name]
+        existing = {index["name"] async for index in collection.list_indexes()}
+        declared = {model.document["name"] for model in models}
+
+        missing = [model for model in models if model.document["name"] not in existing]
+        if missing:
+            await collection.create_indexes(missing)
+
+        extra = sorted(existing - declared - {"_id_"})
+        if drop_extra:
+            for name in extra:
+                await collection.drop_index(name)
+
+        report[collection_name] = {
+            "created": [model.document["name"] for model in missing],
+            "extra": extra,
+        }
+    return report
+
+def _plan_stages(plan: Dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def uses_collection_scan(database, collection_name: str, query: Dict, sort: List) -> bool:
+    cursor = database[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explanation = await cursor.explain()
+    return "COLLSCAN" in _plan_stages(explanation["queryPlanner"]["winningPlan"])
+
+async def find_collection_scans(database) -> List[str]:
+    """Explain every registered query shape and return those planned as COLLSCAN"""
+    return [
+        name for name, collection_name, query, sort in QUERY_SHAPES
+        if await uses_collection_scan(database, collection_name, query, sort)
+    ]
+
+async def _main(args) -> int:
+    from app.database import db, connect_to_mongo, close_mongo_connection
+
+    await connect_to_mongo(create_indexes=False)
+    try:
+        report = await ensure_indexes(db.db, drop_extra=args.drop_extra)
+        for collection_name, result in report.items():
+            print(f"{collection_name}: created={result['created']} extra={result['extra']}")
+
+        if args.check:
+            scans = await find_collection_scans(db.db)
+            for name in scans:
+                print(f"COLLSCAN: {name}")
+            if scans:
+                return 1
+            print("All registered query shapes use an index")
+        return 0
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile and verify MongoDB indexes")
+    parser.add_argument("--drop-extra", action="store_true", help="drop indexes not declared in the registry")
+    parser.add_argument("--check", action="store_true", help="fail if any query shape runs as a COLLSCAN")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -45,12 +45,28 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.database import connect_to_mongo, close_mongo_connection
-from app.routes import auth, products, cart, orders, admin
-from app.config import UPLOAD_DIRECTORY
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from app.config import FAST_JSON_RESPONSES, SERVERLESS
+from app.database import db, connect_to_mongo, close_mongo_connection
+from app.routes import auth, products, cart, orders, admin, uploads, health
+from app.utils.auth_utils import shutdown_password_hashing
+from app.utils.cart_sweeper import start_cart_sweeper, stop_cart_sweeper
+from app.utils.facets import ensure_category_facets
+from app.utils.file_upload import shutdown_image_workers
+from app.utils.idempotency import REPLAYED_HEADER
+from app.utils.inventory import start_inventory_worker, stop_inventory_worker
+from app.utils.metrics import MetricsMiddleware, render_metrics
+from app.utils.outbox import start_outbox_workers, stop_outbox_workers
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.product_cache import (
+    add_product_change_listener, start_product_cache_watcher, stop_product_cache_watcher
+)
+from app.utils.search_index import build_suggest_index, suggest_index
 
-app = FastAPI(title="E-commerce API")
+app = FastAPI(
+    title="E-commerce API",
+    default_response_class=ORJSONResponse if FAST_JSON_RESPONSES else JSONResponse
+)
 
 # CORS configuration
 app.add_middleware(
@@ -59,8 +75,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified", REPLAYED_HEADER],
 )
 
+# Per-route latency histograms and in-flight counts
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(products.router)
@@ -68,18 +88,40 @@ app.include_router(cart.router)
 app.include_router(orders.router)
 app.include_router(admin.router)
 
-# Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIRECTORY), name="uploads")
+# Uploads are served with immutable caching, ETags and Range support
+app.include_router(uploads.router)
+app.include_router(health.router)
 
 # Database connection events
 @app.on_event("startup")
 async def startup_event():
     await connect_to_mongo()
+    # Background tasks are frozen between serverless invocations
+    if not SERVERLESS:
+        health.install_drain_handler()
+        await build_suggest_index(db.db)
+        await ensure_category_facets(db.db)
+        add_product_change_listener(suggest_index.apply_change)
+        start_product_cache_watcher()
+        start_inventory_worker(db.db)
+        start_outbox_workers(db.db)
+        start_cart_sweeper(db.db)
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    health.start_draining()
+    await stop_product_cache_watcher()
+    await stop_inventory_worker()
+    await stop_outbox_workers()
+    await stop_cart_sweeper()
     await close_mongo_connection()
+    shutdown_password_hashing()
+    shutdown_image_workers()
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to E-commerce API (on vercel)"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -38,4 +38,16 @@ class Order(BaseModel):
     updated_at: datetime
 
 class OrderStatusUpdate(BaseModel):
-    status: OrderStatus
\ No newline at end of file
+    status: OrderStatus
+
+class DailySales(BaseModel):
+    day: str = Field(alias="_id")
+    orders: int
+    revenue: float
+    units: int
+
+class ProductSales(BaseModel):
+    product_id: str = Field(alias="_id")
+    name: str
+    units: int
+    revenue: float
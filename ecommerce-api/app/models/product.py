@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 class ProductBase(BaseModel):
@@ -23,5 +23,37 @@ class ProductUpdate(BaseModel):
 
 class Product(ProductBase):
     id: str = Field(alias="_id")
+    image_variants: Optional[Dict[str, str]] = None
+    # Set while the product's stock is split across reservation shards
+    stock_shards: Optional[int] = None
     created_at: datetime
-    updated_at: datetime
\ No newline at end of file
+    updated_at: datetime
+
+class ProductSuggestion(BaseModel):
+    id: str = Field(alias="_id")
+    name: str
+    category: str
+    price: float
+    image_url: Optional[str] = None
+
+class CategoryFacet(BaseModel):
+    category: str = Field(alias="_id")
+    product_count: int
+    in_stock_count: int
+    min_price: float
+    max_price: float
+
+class BulkRowError(BaseModel):
+    line: int
+    id: Optional[str] = None
+    error: str
+
+class BulkResult(BaseModel):
+    processed: int
+    succeeded: int
+    failed: int
+    batches: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[BulkRowError]
+    errors_truncated: bool
\ No newline at end of file
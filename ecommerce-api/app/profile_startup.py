@@ -0,0 +1,72 @@
+"""Cold-start profile: how long `import app.main` takes and which modules dominate it.
+
+    python -m app.profile_startup [--top 15] [--budget-ms 1500] [--json report.json]
+
+Runs the import in a fresh interpreter with `-X importtime` (serverless mode,
+so no database work happens), lists the modules with the most self time and
+exits non-zero when the total exceeds the cold-start budget.
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from app.config import COLD_START_BUDGET_MS
+
+def profile_imports() -> Dict:
+    env = {**os.environ, "SERVERLESS": "true"}
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"import app.main failed:\n{result.stderr}")
+
+    # Lines look like: "import time:  self [us] | cumulative | imported package"
+    modules: List[Dict] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.rstrip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+
+    top_level = [module for module in modules if module["depth"] == 0]
+    import_ms = sum(module["cumulative_ms"] for module in top_level)
+    return {"wall_ms": wall_ms, "import_ms": import_ms, "modules": modules, "top_level": top_level}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profile cold-start import time of app.main")
+    parser.add_argument("--top", type=int, default=15, help="number of modules with the most self time to show")
+    parser.add_argument("--budget-ms", type=int, default=COLD_START_BUDGET_MS)
+    parser.add_argument("--json", help="write the full report to this path")
+    args = parser.parse_args()
+
+    report = profile_imports()
+    print(f"Interpreter + import wall time: {report['wall_ms']:.1f} ms")
+    print(f"Import time (cumulative):       {report['import_ms']:.1f} ms  (budget {args.budget_ms} ms)\n")
+    # Everything hangs off app.main, so rank by each module's own cost rather than its subtree
+    print(f"{'self':>12}  {'cumulative':>12}  module")
+    for module in sorted(report["modules"], key=lambda m: m["self_ms"], reverse=True)[:args.top]:
+        print(f"{module['self_ms']:>9.1f} ms  {module['cumulative_ms']:>9.1f} ms  {module['module'].strip()}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({**report, "budget_ms": args.budget_ms}, f, indent=2)
+
+    if report["import_ms"] > args.budget_ms:
+        print(f"\nOver cold-start budget by {report['import_ms'] - args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
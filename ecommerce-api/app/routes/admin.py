@@ -1,19 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from app.config import ADMIN_ORDERS_PAGE_SIZE, ORDER_EXPORT_BATCH_SIZE
 from app.database import db
 from app.models.user import User
-from app.models.product import Product, ProductCreate, ProductUpdate
-from app.models.order import Order, OrderStatusUpdate
-from app.utils.auth_utils import get_current_admin
+from app.models.product import BulkResult, Product, ProductCreate, ProductUpdate
+from app.models.order import DailySales, Order, OrderStatus, OrderStatusUpdate, ProductSales
+from app.utils.auth_utils import get_current_admin, user_cache
+from app.utils.bulk_import import import_products, update_products
+from app.utils.facets import add_product_facets, remove_product_facets, update_product_facets
 from app.utils.file_upload import save_upload_file
+from app.utils.idempotency import idempotent
+from app.utils.inventory import reconcile_stock, shard_product_stock, sweep_expired, unshard_product_stock
+from app.utils.order_events import ORDER_STATUS_CHANGED
+from app.utils.outbox import PENDING_EVENTS, drain, new_event, outbox_stats, relay_now
+from app.utils.pagination import KEYSET_SORT, NEXT_CURSOR_HEADER, apply_cursor, next_cursor
+from app.utils.product_cache import invalidate_product, product_cache
+from app.utils.search_index import suggest_index
+from app.utils.serialization import render
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+import csv
+import io
+import json
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
-# Product management routes
+# Re-read the order this many times when its status changes under a status update
+STATUS_UPDATE_ATTEMPTS = 3
+
+# Product management routes; JSON writes honour Idempotency-Key so retries don't repeat them
 @router.post("/products", response_model=Product)
-async def create_product(product: ProductCreate, current_user: User = Depends(get_current_admin)):
+async def create_product(
+    product: ProductCreate,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_admin)
+):
+    return await idempotent(request, response, current_user.id, lambda: _create_product(product))
+
+async def _create_product(product: ProductCreate):
     now = datetime.utcnow()
     new_product = {
         "_id": str(ObjectId()),
@@ -23,14 +50,39 @@ async def create_product(product: ProductCreate, current_user: User = Depends(ge
     }
     
     await db.db.products.insert_one(new_product)
+    invalidate_product(new_product["_id"], [new_product["category"]])
+    suggest_index.upsert(new_product)
+    await add_product_facets(db.db, new_product)
     return new_product
 
+# Bulk routes take a CSV (with a header row) or NDJSON upload
+@router.post("/products/import", response_model=BulkResult)
+async def import_product_file(
+    file: UploadFile = File(...),
+    file_format: str = Query("csv", alias="format", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_admin)
+):
+    return await import_products(db.db, file, file_format)
+
+@router.post("/products/bulk-update", response_model=BulkResult)
+async def bulk_update_products(
+    file: UploadFile = File(...),
+    file_format: str = Query("csv", alias="format", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_admin)
+):
+    return await update_products(db.db, file, file_format)
+
 @router.put("/products/{product_id}", response_model=Product)
 async def update_product(
     product_id: str, 
     product_update: ProductUpdate, 
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_admin)
 ):
+    return await idempotent(request, response, current_user.id, lambda: _update_product(product_id, product_update))
+
+async def _update_product(product_id: str, product_update: ProductUpdate):
     # Check if product exists
     product = await db.db.products.find_one({"_id": product_id})
     if not product:
@@ -41,25 +93,68 @@ async def update_product(
         k: v for k, v in product_update.model_dump(exclude_unset=True).items() 
         if v is not None
     }
+    if "stock" in update_data and product.get("stock_shards"):
+        raise HTTPException(status_code=409, detail="Stock is sharded; unshard the product before setting it")
     
     if update_data:
         update_data["updated_at"] = datetime.utcnow()
-        await db.db.products.update_one(
+        # The document as this write found it, so concurrent stock changes are counted once
+        previous = await db.db.products.find_one_and_update(
             {"_id": product_id},
             {"$set": update_data}
         )
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        invalidate_product(product_id, {previous["category"], update_data.get("category", previous["category"])})
+        if update_data.keys() & {"category", "price", "stock"}:
+            await update_product_facets(db.db, previous, {**previous, **update_data})
     
-    return await db.db.products.find_one({"_id": product_id})
+    updated_product = await db.db.products.find_one({"_id": product_id})
+    suggest_index.upsert(updated_product)
+    return updated_product
 
 @router.delete("/products/{product_id}")
-async def delete_product(product_id: str, current_user: User = Depends(get_current_admin)):
-    product = await db.db.products.find_one({"_id": product_id})
+async def delete_product(
+    product_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_admin)
+):
+    return await idempotent(request, response, current_user.id, lambda: _delete_product(product_id))
+
+async def _delete_product(product_id: str):
+    product = await db.db.products.find_one_and_delete({"_id": product_id})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    await db.db.products.delete_one({"_id": product_id})
+    if product.get("stock_shards"):
+        await db.db.stock_shards.delete_many({"product_id": product_id})
+    invalidate_product(product_id, [product["category"]])
+    suggest_index.remove(product_id)
+    await remove_product_facets(db.db, product)
     return {"message": "Product deleted successfully"}
 
+# Hot products: split stock across counters so concurrent buyers don't contend on one document
+@router.post("/products/{product_id}/stock-shards", response_model=Product)
+async def shard_stock(
+    product_id: str,
+    shards: int = Query(8, ge=2, le=64),
+    current_user: User = Depends(get_current_admin)
+):
+    product = await shard_product_stock(db.db, product_id, shards)
+    invalidate_product(product_id, [product["category"]])
+    return product
+
+@router.delete("/products/{product_id}/stock-shards", response_model=Product)
+async def unshard_stock(product_id: str, current_user: User = Depends(get_current_admin)):
+    return await unshard_product_stock(db.db, product_id)
+
+# The inventory worker's upkeep, run inline (e.g. from a cron on serverless, where the worker doesn't run)
+@router.post("/inventory/maintain")
+async def maintain_inventory(current_user: User = Depends(get_current_admin)):
+    released = await sweep_expired(db.db)
+    await reconcile_stock(db.db)
+    return {"released": released}
+
 @router.post("/products/{product_id}/upload-image", response_model=Product)
 async def upload_product_image(
     product_id: str, 
@@ -71,43 +166,206 @@ async def upload_product_image(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Upload image
-    image_path = await save_upload_file(image)
+    # Upload image and its resized variants
+    image_urls = await save_upload_file(image)
     
-    # Update product with image URL
-    await db.db.products.update_one(
+    # Update product with image URLs
+    updated_product = await db.db.products.find_one_and_update(
         {"_id": product_id},
-        {"$set": {"image_url": image_path, "updated_at": datetime.utcnow()}}
+        {
+            "$set": {
+                "image_url": image_urls.pop("original"),
+                "image_variants": image_urls,
+                "updated_at": datetime.utcnow()
+            }
+        },
+        return_document=ReturnDocument.AFTER
     )
-    
-    return await db.db.products.find_one({"_id": product_id})
+    invalidate_product(product_id, [updated_product["category"]])
+    suggest_index.upsert(updated_product)
+    return updated_product
 
 # Order management routes
+def _order_filters(
+    status: Optional[OrderStatus],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime]
+) -> Dict:
+    query = {}
+    if status:
+        query["status"] = status
+    if date_from or date_to:
+        query["created_at"] = {}
+        if date_from:
+            query["created_at"]["$gte"] = date_from
+        if date_to:
+            query["created_at"]["$lt"] = date_to
+    return query
+
 @router.get("/orders", response_model=List[Order])
-async def get_all_orders(current_user: User = Depends(get_current_admin)):
-    orders = await db.db.orders.find().sort("created_at", -1).to_list(None)
-    return orders
+async def get_all_orders(
+    response: Response,
+    status: Optional[OrderStatus] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(ADMIN_ORDERS_PAGE_SIZE, ge=1, le=500),
+    current_user: User = Depends(get_current_admin)
+):
+    query = apply_cursor(_order_filters(status, date_from, date_to), cursor)
+    orders = await db.db.orders.find(query).sort(KEYSET_SORT).limit(limit).to_list(length=limit)
+
+    cursor_after = next_cursor(orders, limit)
+    if cursor_after:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_after
+    return render(Order, orders, response, many=True)
+
+ORDER_EXPORT_FIELDS = ["_id", "user_id", "status", "total", "item_count", "city", "country", "created_at", "updated_at"]
+
+@router.get("/orders/export")
+async def export_orders(
+    file_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    status: Optional[OrderStatus] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    cursor = db.db.orders.find(
+        _order_filters(status, date_from, date_to),
+        {
+            "user_id": 1, "status": 1, "total": 1, "items": 1,
+            "shipping_address.city": 1, "shipping_address.country": 1,
+            "created_at": 1, "updated_at": 1
+        },
+        batch_size=ORDER_EXPORT_BATCH_SIZE
+    ).sort(KEYSET_SORT)
+
+    if file_format == "csv":
+        media_type, filename = "text/csv", "orders.csv"
+    else:
+        media_type, filename = "application/x-ndjson", "orders.ndjson"
+
+    return StreamingResponse(
+        _stream_orders(cursor, file_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+async def _stream_orders(cursor, file_format: str):
+    """Yield one encoded chunk per Motor batch so memory stays flat"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ORDER_EXPORT_FIELDS)
+    if file_format == "csv":
+        writer.writeheader()
+
+    count = 0
+    async for order in cursor:
+        address = order.get("shipping_address", {})
+        row = {
+            "_id": order["_id"],
+            "user_id": order["user_id"],
+            "status": order["status"],
+            "total": order["total"],
+            "item_count": sum(item["quantity"] for item in order.get("items", [])),
+            "city": address.get("city"),
+            "country": address.get("country"),
+            "created_at": order["created_at"].isoformat(),
+            "updated_at": order["updated_at"].isoformat()
+        }
+        if file_format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row) + "\n")
+
+        count += 1
+        if count % ORDER_EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
 
 @router.put("/orders/{order_id}/status", response_model=Order)
 async def update_order_status(
     order_id: str, 
     status_update: OrderStatusUpdate, 
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_admin)
 ):
-    # Check if order exists
-    order = await db.db.orders.find_one({"_id": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    # Update order status
-    await db.db.orders.update_one(
-        {"_id": order_id},
-        {
-            "$set": {
-                "status": status_update.status,
-                "updated_at": datetime.utcnow()
-            }
-        }
+    return await idempotent(
+        request, response, current_user.id, lambda: _update_order_status(order_id, status_update)
     )
-    
-    return await db.db.orders.find_one({"_id": order_id})
\ No newline at end of file
+
+async def _update_order_status(order_id: str, status_update: OrderStatusUpdate):
+    # Update order status; the previous document tells the rollups which bucket it left
+    changes = {"status": status_update.status, "updated_at": datetime.utcnow()}
+    order = await _set_order_status(order_id, changes)
+    await relay_now(db.db, "orders", order_id)
+    return {**order, **changes}
+
+async def _set_order_status(order_id: str, changes: Dict) -> Dict:
+    # The event carries the order as it was, so read it first and only write if the status
+    # is still the one read; the event is pushed in the same write as the new status
+    for _ in range(STATUS_UPDATE_ATTEMPTS):
+        order = await db.db.orders.find_one({"_id": order_id}, {PENDING_EVENTS: 0})
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+
+        update = {"$set": changes}
+        if order["status"] != changes["status"]:
+            update["$push"] = {PENDING_EVENTS: new_event(ORDER_STATUS_CHANGED, {"order": order, "status": changes["status"]})}
+        if await db.db.orders.find_one_and_update({"_id": order_id, "status": order["status"]}, update, {"_id": 1}):
+            return order
+    raise HTTPException(status_code=409, detail="Order status is changing concurrently; retry")
+
+# Dashboard statistics, read from the rollups maintained by checkout and status changes
+@router.get("/stats/sales", response_model=List[DailySales])
+async def get_sales_stats(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    query = {}
+    if date_from or date_to:
+        query["_id"] = {}
+        if date_from:
+            query["_id"]["$gte"] = date_from.strftime("%Y-%m-%d")
+        # Rows are whole days, so the day containing date_to is included
+        if date_to:
+            query["_id"]["$lte"] = date_to.strftime("%Y-%m-%d")
+    # `applied` is the outbox's redelivery guard, not part of the figures
+    return await db.db.sales_daily.find(query, {"applied": 0}).sort("_id", 1).to_list(None)
+
+@router.get("/stats/status", response_model=Dict[OrderStatus, int])
+async def get_status_stats(current_user: User = Depends(get_current_admin)):
+    counts = {status.value: 0 for status in OrderStatus}
+    async for row in db.db.order_status_counts.find({}, {"count": 1}):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+@router.get("/stats/top-products", response_model=List[ProductSales])
+async def get_top_products(
+    by: str = Query("units", pattern="^(units|revenue)$"),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_admin)
+):
+    return await db.db.product_sales.find({}, {"applied": 0}).sort(by, -1).limit(limit).to_list(length=limit)
+
+# Outbox monitoring; drain processes due events inline (e.g. from a cron on serverless)
+@router.get("/outbox")
+async def get_outbox_stats(current_user: User = Depends(get_current_admin)):
+    return await outbox_stats(db.db)
+
+@router.post("/outbox/drain")
+async def drain_outbox(
+    batches: int = Query(1, ge=1, le=20),
+    current_user: User = Depends(get_current_admin)
+):
+    return {"processed": await drain(db.db, max_batches=batches)}
+
+# Cache monitoring routes
+@router.get("/cache")
+async def get_cache_stats(current_user: User = Depends(get_current_admin)):
+    return {"users": user_cache.stats(), "products": product_cache.stats()}
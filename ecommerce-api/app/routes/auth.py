@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordRequestForm
+from typing import Dict, Optional
 from datetime import timedelta
 from app.database import db
-from app.models.user import UserCreate, User, Token, UserLogin
-from app.utils.auth_utils import verify_password, get_password_hash, create_access_token, get_current_user
+from app.models.user import UserCreate, User, Token, UserLogin, RefreshRequest
+from app.utils.auth_utils import (
+    optional_oauth2_scheme, verify_password, get_password_hash, create_access_token, create_refresh_token,
+    credentials_error, decode_token, get_current_user, invalidate_user, user_claims
+)
+from app.utils.revocation import revoke_token
 from app.config import ACCESS_TOKEN_EXPIRE_MINUTES
 from datetime import datetime
 from bson import ObjectId
@@ -21,7 +26,7 @@ async def signup(user_create: UserCreate):
     now = datetime.utcnow()
     user_dict = user_create.model_dump()
     
-    hashed_password = get_password_hash(user_dict.pop("password"))
+    hashed_password = await get_password_hash(user_dict.pop("password"))
     new_user = {
         "_id": str(ObjectId()),
         **user_dict,
@@ -31,6 +36,7 @@ async def signup(user_create: UserCreate):
     }
     
     await db.db.users.insert_one(new_user)
+    invalidate_user(new_user["email"])
     return new_user
 
 @router.post("/login", response_model=Token)
@@ -45,29 +51,57 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     
     # Verify password
-    if not verify_password(form_data.password, user["hashed_password"]):
+    if not await verify_password(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Generate access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user["email"], "role": user["role"]}, 
-        expires_delta=access_token_expires
-    )
+    return _issue_tokens(user)
+
+@router.post("/refresh", response_model=Token)
+async def refresh(refresh_request: RefreshRequest):
+    payload = await decode_token(refresh_request.refresh_token, token_type="refresh")
+    
+    # Refresh re-reads the user, so role changes and deleted accounts take effect here
+    user = await db.db.users.find_one({"_id": payload["uid"]})
+    if not user:
+        raise credentials_error()
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Rotate: each refresh token can be used once
+    if not await revoke_token(db.db, payload["jti"], payload["exp"]):
+        raise credentials_error()
+    return _issue_tokens(user)
 
 @router.post("/logout")
-async def logout(response: Response):
-    # Since JWT is stateless, we can only tell the client to remove the token
-    # In a real application, you might want to implement token blacklisting
+async def logout(
+    response: Response,
+    refresh_request: Optional[RefreshRequest] = None,
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+):
+    # Revoke whatever valid tokens the client still presents; logging out never fails
+    tokens = [(token, "access")] if token else []
+    if refresh_request is not None:
+        tokens.append((refresh_request.refresh_token, "refresh"))
+    for value, token_type in tokens:
+        try:
+            payload = await decode_token(value, token_type=token_type)
+        except HTTPException:
+            continue
+        if "jti" in payload:
+            await revoke_token(db.db, payload["jti"], payload["exp"])
+    
     response.delete_cookie(key="access_token")
     return {"message": "Successfully logged out"}
 
 @router.get("/me", response_model=User)
 async def get_user_me(current_user: User = Depends(get_current_user)):
-    return current_user
\ No newline at end of file
+    return current_user
+
+def _issue_tokens(user: Dict) -> Dict:
+    access_token = create_access_token(
+        data=user_claims(user),
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "refresh_token": create_refresh_token(user), "token_type": "bearer"}
\ No newline at end of file
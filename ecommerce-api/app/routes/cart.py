@@ -1,122 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import Dict, List
 from app.database import db
 from app.models.user import User
 from app.models.cart import Cart, AddToCartRequest, CartItem
 from app.utils.auth_utils import get_current_user
+from app.utils.inventory import cancel_reservation, release, reserve
+from app.utils.http_cache import VERSION_FIELDS, conditional_response, document_validators, wants_revalidation
+from app.utils.serialization import render
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter(prefix="/cart", tags=["Cart"])
 
 @router.get("/", response_model=Cart)
-async def get_cart(current_user: User = Depends(get_current_user)):
+async def get_cart(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    if wants_revalidation(request):
+        version = await db.db.carts.find_one({"user_id": current_user.id}, VERSION_FIELDS)
+        if version:
+            not_modified = conditional_response(request, response, *document_validators(version))
+            if not_modified:
+                return not_modified
+
     cart = await db.db.carts.find_one({"user_id": current_user.id})
     if not cart:
-        # Create empty cart if not exists
-        now = datetime.utcnow()
-        cart = {
-            "_id": str(ObjectId()),
-            "user_id": current_user.id,
-            "items": [],
-            "created_at": now,
-            "updated_at": now
-        }
-        await db.db.carts.insert_one(cart)
-    return cart
+        # Nothing is stored until the first add; there is nothing to revalidate either
+        return render(Cart, _empty_cart(current_user.id))
+
+    conditional_response(request, response, *document_validators(cart))
+    return render(Cart, cart, response)
 
 @router.post("/add", response_model=Cart)
 async def add_to_cart(item: AddToCartRequest, current_user: User = Depends(get_current_user)):
     # Check if product exists and has stock
-    product = await db.db.products.find_one({"_id": item.product_id})
+    product = await db.db.products.find_one(
+        {"_id": item.product_id}, {"name": 1, "price": 1, "stock": 1, "stock_shards": 1}
+    )
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    if product["stock"] < item.quantity:
+    # Hot products hold their stock now rather than racing for it at checkout
+    reservation = None
+    if product.get("stock_shards"):
+        reservation = await reserve(db.db, current_user.id, product["_id"], product["stock_shards"], item.quantity)
+    elif product["stock"] < item.quantity:
         raise HTTPException(status_code=400, detail="Not enough stock available")
     
-    # Get or create cart
-    cart = await db.db.carts.find_one({"user_id": current_user.id})
-    now = datetime.utcnow()
-    
-    if not cart:
-        # Create new cart
-        cart = {
-            "_id": str(ObjectId()),
-            "user_id": current_user.id,
-            "items": [],
-            "created_at": now,
-            "updated_at": now
-        }
-        await db.db.carts.insert_one(cart)
-    
-    # Check if item already in cart
-    cart_item_exists = False
-    for cart_item in cart.get("items", []):
-        if cart_item["product_id"] == item.product_id:
-            cart_item["quantity"] += item.quantity
-            cart_item_exists = True
-            break
+    try:
+        return await _add_item(current_user.id, product, item.quantity, datetime.utcnow())
+    except Exception:
+        if reservation:
+            await cancel_reservation(db.db, reservation["_id"])
+        raise
+
+async def _add_item(user_id: str, product: Dict, quantity: int, now: datetime):
+    cart_item = CartItem(
+        product_id=product["_id"],
+        name=product["name"],
+        price=product["price"],
+        quantity=quantity
+    )
+    # Bump the line if the product is already in the cart, append it otherwise
+    cart = await db.db.carts.find_one_and_update(
+        {"user_id": user_id},
+        _add_item_pipeline(cart_item, now),
+        return_document=ReturnDocument.AFTER
+    )
+    if cart:
+        return cart
     
-    if not cart_item_exists:
-        # Add new item to cart
-        cart_item = CartItem(
-            product_id=product["_id"],
-            name=product["name"],
-            price=product["price"],
-            quantity=item.quantity
+    # First add: create the cart
+    new_cart = {
+        "_id": str(ObjectId()),
+        "user_id": user_id,
+        "items": [cart_item.model_dump()],
+        "created_at": now,
+        "updated_at": now
+    }
+    try:
+        await db.db.carts.insert_one(new_cart)
+        return new_cart
+    except DuplicateKeyError:
+        # A concurrent add created it first (carts.user_id is unique); add to that one
+        return await db.db.carts.find_one_and_update(
+            {"user_id": user_id},
+            _add_item_pipeline(cart_item, now),
+            return_document=ReturnDocument.AFTER
         )
-        cart.setdefault("items", []).append(cart_item.model_dump())
-    
-    # Update cart
-    await db.db.carts.update_one(
-        {"_id": cart["_id"]},
-        {
-            "$set": {
-                "items": cart["items"],
-                "updated_at": now
-            }
+
+def _add_item_pipeline(cart_item: CartItem, now: datetime) -> List[Dict]:
+    """Update pipeline that merges `cart_item` into the cart's items in one atomic write"""
+    # $literal keeps product names and ids that start with "$" from being read as field paths
+    product_id = {"$literal": cart_item.product_id}
+    incremented = {field: f"$$item.{field}" for field in CartItem.model_fields}
+    incremented["quantity"] = {"$add": ["$$item.quantity", cart_item.quantity]}
+    return [{
+        "$set": {
+            "items": {
+                "$cond": [
+                    {"$in": [product_id, "$items.product_id"]},
+                    {
+                        "$map": {
+                            "input": "$items",
+                            "as": "item",
+                            "in": {"$cond": [{"$eq": ["$$item.product_id", product_id]}, incremented, "$$item"]}
+                        }
+                    },
+                    {"$concatArrays": ["$items", {"$literal": [cart_item.model_dump()]}]}
+                ]
+            },
+            "updated_at": now
         }
-    )
-    
-    return await db.db.carts.find_one({"_id": cart["_id"]})
+    }]
 
 @router.post("/remove/{product_id}", response_model=Cart)
 async def remove_from_cart(product_id: str, current_user: User = Depends(get_current_user)):
-    cart = await db.db.carts.find_one({"user_id": current_user.id})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    # Filter out the item to remove
-    cart["items"] = [item for item in cart["items"] if item["product_id"] != product_id]
-    
-    # Update cart
-    await db.db.carts.update_one(
-        {"_id": cart["_id"]},
+    cart = await db.db.carts.find_one_and_update(
+        {"user_id": current_user.id},
         {
-            "$set": {
-                "items": cart["items"],
-                "updated_at": datetime.utcnow()
-            }
-        }
+            "$pull": {"items": {"product_id": product_id}},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        return_document=ReturnDocument.AFTER
     )
+    await release(db.db, current_user.id, product_id)
+    if not cart:
+        return _empty_cart(current_user.id)
     
-    return await db.db.carts.find_one({"_id": cart["_id"]})
+    # Don't keep empty carts around; the guard skips a cart an add just refilled
+    if not cart["items"]:
+        await db.db.carts.delete_one({"_id": cart["_id"], "items": {"$size": 0}})
+    return cart
 
 @router.post("/clear", response_model=Cart)
 async def clear_cart(current_user: User = Depends(get_current_user)):
-    cart = await db.db.carts.find_one({"user_id": current_user.id})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    # Clear cart items
-    await db.db.carts.update_one(
-        {"_id": cart["_id"]},
-        {
-            "$set": {
-                "items": [],
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
-    
-    return await db.db.carts.find_one({"_id": cart["_id"]})
\ No newline at end of file
+    await db.db.carts.delete_one({"user_id": current_user.id})
+    await release(db.db, current_user.id)
+    return _empty_cart(current_user.id)
+
+def _empty_cart(user_id: str) -> Dict:
+    # Unsaved, so it gets a throwaway id; the stored cart gets its own on first add
+    now = datetime.utcnow()
+    return {"_id": str(ObjectId()), "user_id": user_id, "items": [], "created_at": now, "updated_at": now}
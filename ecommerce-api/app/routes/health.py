@@ -0,0 +1,68 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.config import HEALTH_CHECK_TIMEOUT_MS, SHUTDOWN_GRACE_SECONDS
+from app.database import db
+from app.utils.metrics import pool_stats
+import asyncio
+import os
+import signal
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+class _State:
+    draining = False
+
+state = _State()
+
+def start_draining() -> None:
+    """Fail readiness so load balancers stop routing new traffic before shutdown"""
+    state.draining = True
+
+def install_drain_handler() -> None:
+    """Make SIGTERM fail readiness for SHUTDOWN_GRACE_SECONDS before the server shuts down.
+
+    Call from startup, after the server has installed its own signal handlers.
+    The server still listens during the grace period; then the handler sends
+    SIGINT, which uvicorn answers with its usual graceful shutdown.
+    """
+    if SHUTDOWN_GRACE_SECONDS <= 0:
+        return
+
+    loop = asyncio.get_running_loop()
+
+    def shut_down() -> None:
+        loop.remove_signal_handler(signal.SIGTERM)
+        os.kill(os.getpid(), signal.SIGINT)
+
+    def on_sigterm() -> None:
+        if state.draining:
+            # A second SIGTERM skips the rest of the grace period
+            shut_down()
+            return
+        start_draining()
+        print(f"🛑 SIGTERM received, draining for {SHUTDOWN_GRACE_SECONDS:g}s before shutdown")
+        loop.call_later(SHUTDOWN_GRACE_SECONDS, shut_down)
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Windows, or not running in the main thread: keep the server's own handling
+        pass
+
+@router.get("/live")
+async def live():
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def ready():
+    if state.draining:
+        return JSONResponse(status_code=503, content={"status": "draining"})
+
+    try:
+        await asyncio.wait_for(db.client.admin.command("ping"), timeout=HEALTH_CHECK_TIMEOUT_MS / 1000)
+    except Exception as e:
+        # Driver errors name hosts and topology; log them rather than return them
+        print("❌ Readiness check failed:", repr(e))
+        return JSONResponse(status_code=503, content={"status": "unavailable", "pool": pool_stats()})
+
+    return {"status": "ready", "pool": pool_stats()}
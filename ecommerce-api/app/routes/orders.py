@@ -1,28 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import Dict, List
+from app.config import CHECKOUT_USE_TRANSACTIONS
 from app.database import db
 from app.models.user import User
 from app.models.order import Order, OrderCreate, OrderStatus
 from app.utils.auth_utils import get_current_user
+from app.utils.facets import adjust_in_stock, in_stock_delta
+from app.utils.inventory import consume, give_back
+from app.utils.order_events import ORDER_PLACED
+from app.utils.outbox import PENDING_EVENTS, new_event, relay_now
+from app.utils.product_cache import invalidate_product
+from app.utils.idempotency import idempotent
+from app.utils.http_cache import VERSION_FIELDS, conditional_response, document_validators, wants_revalidation
+from app.utils.serialization import render
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+import asyncio
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
 @router.get("/", response_model=List[Order])
 async def get_orders(current_user: User = Depends(get_current_user)):
     orders = await db.db.orders.find({"user_id": current_user.id}).sort("created_at", -1).to_list(None)
-    return orders
+    return render(Order, orders, many=True)
 
 @router.get("/{order_id}", response_model=Order)
-async def get_order(order_id: str, current_user: User = Depends(get_current_user)):
+async def get_order(
+    order_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    if wants_revalidation(request):
+        version = await db.db.orders.find_one({"_id": order_id, "user_id": current_user.id}, VERSION_FIELDS)
+        if version:
+            not_modified = conditional_response(request, response, *document_validators(version))
+            if not_modified:
+                return not_modified
+
     order = await db.db.orders.find_one({"_id": order_id, "user_id": current_user.id})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+
+    conditional_response(request, response, *document_validators(order))
+    return render(Order, order, response)
 
 @router.post("/checkout", response_model=Order)
-async def checkout(order_create: OrderCreate, current_user: User = Depends(get_current_user)):
+async def checkout(
+    order_create: OrderCreate,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    # Clients retry on timeout; an Idempotency-Key makes the retry replay the first order
+    return await idempotent(request, response, current_user.id, lambda: _checkout(order_create, current_user))
+
+async def _checkout(order_create: OrderCreate, current_user: User):
     # Get user's cart
     cart = await db.db.carts.find_one({"user_id": current_user.id})
     if not cart or not cart.get("items"):
@@ -31,11 +65,22 @@ async def checkout(order_create: OrderCreate, current_user: User = Depends(get_c
     # Calculate total
     total = sum(item["price"] * item["quantity"] for item in cart["items"])
     
-    # Check stock for each product
+    # Check stock for every product in a single round trip
+    quantities = {}
+    for item in cart["items"]:
+        quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+
+    products = {
+        product["_id"]: product
+        async for product in db.db.products.find({"_id": {"$in": list(quantities)}}, {"stock": 1, "category": 1, "stock_shards": 1})
+    }
     for item in cart["items"]:
-        product = await db.db.products.find_one({"_id": item["product_id"]})
-        if not product or product["stock"] < item["quantity"]:
+        product = products.get(item["product_id"])
+        # Sharded stock excludes the user's own holds, so it is checked when they are consumed
+        if not product or (not product.get("stock_shards") and product["stock"] < quantities[item["product_id"]]):
             raise HTTPException(status_code=400, detail=f"Not enough stock for product: {item['name']}")
+    sharded = {product_id: qty for product_id, qty in quantities.items() if products[product_id].get("stock_shards")}
+    regular = {product_id: qty for product_id, qty in quantities.items() if product_id not in sharded}
     
     # Create order
     now = datetime.utcnow()
@@ -50,19 +95,130 @@ async def checkout(order_create: OrderCreate, current_user: User = Depends(get_c
         "updated_at": now
     }
     
-    await db.db.orders.insert_one(new_order)
+    # Hot products: turn the cart's holds into sold stock, handing it back if the order isn't stored
+    consumed = {}
+    try:
+        for product_id, qty in sharded.items():
+            consumed[product_id] = await consume(
+                db.db, current_user.id, product_id, products[product_id]["stock_shards"], qty
+            )
+        await _place_order(new_order, cart["_id"], regular)
+    except Exception:
+        for product_id, allocations in consumed.items():
+            await give_back(db.db, product_id, allocations)
+        raise
+    finally:
+        # Don't wait for the change stream (which needs a replica set) to drop this worker's copies
+        for product_id in regular:
+            invalidate_product(product_id, [products[product_id]["category"]])
     
-    # Update product stock
-    for item in cart["items"]:
-        await db.db.products.update_one(
-            {"_id": item["product_id"]},
-            {"$inc": {"stock": -item["quantity"]}}
+    return new_order
+
+async def _place_order(new_order: Dict, cart_id: str, quantities: Dict[str, int]):
+    """Take the stock and store the order; raises only if the order wasn't stored"""
+    # Analytics and facet updates run from the outbox, off the request path. The event goes
+    # in with the order, so the two can't be separated by a crash between writes.
+    if CHECKOUT_USE_TRANSACTIONS:
+        async with await db.client.start_session() as session:
+            async with session.start_transaction():
+                sold_out = await _decrement_stock(quantities, session=session)
+                await db.db.orders.insert_one(_with_order_placed(new_order, sold_out), session=session)
+                await _clear_cart(cart_id, session=session)
+    else:
+        sold_out = await _decrement_stock(quantities)
+        try:
+            await db.db.orders.insert_one(_with_order_placed(new_order, sold_out))
+        except Exception:
+            await _restore_stock(quantities, sold_out)
+            raise
+        try:
+            await _clear_cart(cart_id)
+        except Exception as e:
+            # The order stands; failing now would hand its stock back and let a retry place it twice
+            print(f"❌ Clearing cart {cart_id} after order {new_order['_id']} failed:", repr(e))
+    await relay_now(db.db, "orders", new_order["_id"])
+
+def _with_order_placed(order: Dict, sold_out: List[str]) -> Dict:
+    # Categories aren't safe as document keys, so sold-out products are listed by category, one entry each
+    event = new_event(ORDER_PLACED, {"order": order, "sold_out_categories": sold_out})
+    return {**order, PENDING_EVENTS: [event]}
+
+def _stock_filter(product_id: str, qty: int) -> Dict:
+    # Products sharded since the cart was read are left to the shards
+    return {"_id": product_id, "stock": {"$gte": qty}, "stock_shards": {"$exists": False}}
+
+def _stock_update(qty: int) -> Dict:
+    # updated_at is the product's ETag version, so every stock write bumps it
+    return {"$inc": {"stock": qty}, "$set": {"updated_at": datetime.utcnow()}}
+
+async def _decrement_stock(quantities: Dict[str, int], session=None) -> List[str]:
+    """Atomically take stock for every line; all lines succeed or none do.
+
+    Returns the category of each product this checkout sold out.
+    """
+    if not quantities:
+        return []
+
+    if session is not None:
+        result = await db.db.products.bulk_write(
+            [UpdateOne(_stock_filter(product_id, qty), _stock_update(-qty)) for product_id, qty in quantities.items()],
+            ordered=False,
+            session=session
         )
-    
-    # Clear the cart
-    await db.db.carts.update_one(
-        {"_id": cart["_id"]},
-        {"$set": {"items": [], "updated_at": now}}
-    )
-    
-    return await db.db.orders.find_one({"_id": new_order["_id"]})
\ No newline at end of file
+        if result.matched_count < len(quantities):
+            # Raising inside the transaction aborts it
+            raise HTTPException(status_code=400, detail="Not enough stock for one or more products")
+        # Every line had stock before this write, and a concurrent change to these documents would abort the transaction
+        sold_out = db.db.products.find({"_id": {"$in": list(quantities)}, "stock": {"$lte": 0}}, {"category": 1}, session=session)
+        return [product["category"] async for product in sold_out]
+
+    # Without a transaction, send the lines concurrently so each result says whether
+    # that product was decremented, and a partial failure undoes exactly those
+    results = await asyncio.gather(*(
+        db.db.products.find_one_and_update(
+            _stock_filter(product_id, qty),
+            _stock_update(-qty),
+            projection={"stock": 1, "category": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        for product_id, qty in quantities.items()
+    ), return_exceptions=True)
+    taken = {
+        product_id: product
+        for product_id, product in zip(quantities, results)
+        if product is not None and not isinstance(product, BaseException)
+    }
+    sold_out = [product["category"] for product in taken.values() if product["stock"] <= 0]
+    if len(taken) < len(quantities):
+        await _restore_stock({product_id: quantities[product_id] for product_id in taken}, sold_out)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        raise HTTPException(status_code=400, detail="Not enough stock for one or more products")
+    return sold_out
+
+async def _restore_stock(quantities: Dict[str, int], sold_out: List[str]):
+    """Hand back stock from a checkout that failed before reporting the products it sold out"""
+    if not quantities:
+        return
+    restored = await asyncio.gather(*(
+        db.db.products.find_one_and_update(
+            {"_id": product_id},
+            _stock_update(qty),
+            projection={"stock": 1, "category": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        for product_id, qty in quantities.items()
+    ))
+    # Usually nets to zero; it doesn't if another write changed the stock in between
+    deltas: Dict[str, int] = {}
+    for category in sold_out:
+        deltas[category] = deltas.get(category, 0) - 1
+    for product, qty in zip(restored, quantities.values()):
+        if product:
+            deltas[product["category"]] = deltas.get(product["category"], 0) + in_stock_delta(product["stock"] - qty, product["stock"])
+    await adjust_in_stock(db.db, deltas)
+
+async def _clear_cart(cart_id: str, session=None):
+    # Carts are created lazily on the next add, so an emptied cart is simply removed
+    await db.db.carts.delete_one({"_id": cart_id}, session=session)
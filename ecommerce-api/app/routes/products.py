@@ -1,19 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List, Optional
 from app.database import db
 from app.models.user import User
-from app.models.product import Product, ProductCreate, ProductUpdate
+from app.models.product import CategoryFacet, Product, ProductCreate, ProductSuggestion, ProductUpdate
 from app.utils.auth_utils import get_current_user
+from app.utils.http_cache import (
+    VERSION_FIELDS, conditional_response, document_validators, page_validators, wants_revalidation
+)
+from app.utils.pagination import KEYSET_SORT, NEXT_CURSOR_HEADER, apply_cursor, next_cursor
+from app.utils.product_cache import fill, fill_token, product_cache
+from app.utils.search_index import build_suggest_index, suggest_index
+from app.utils.serialization import render
 from datetime import datetime
 from bson import ObjectId
-from pymongo import DESCENDING
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 @router.get("/", response_model=List[Product])
 async def get_products(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
     category: Optional[str] = None,
     search: Optional[str] = None,
     current_user: User = Depends(get_current_user)
@@ -25,14 +34,75 @@ async def get_products(
     if search:
         query["$text"] = {"$search": search}
     
-    # Execute query with pagination
-    cursor = db.db.products.find(query).skip(skip).limit(limit).sort("created_at", DESCENDING)
-    products = await cursor.to_list(length=limit)
-    return products
+    # Keyset pagination when a cursor is given, skip/limit otherwise
+    if cursor:
+        if skip:
+            raise HTTPException(status_code=400, detail="Use either skip or cursor, not both")
+        query = apply_cursor(query, cursor)
+
+    # Serve repeated listing pages from the in-process catalog cache
+    cache_key = ("list", category, search, skip, cursor, limit)
+    products = product_cache.get(cache_key)
+    token = fill_token(cache_key)
+    if products is None and wants_revalidation(request):
+        # Check the page's versions before fetching full documents
+        versions = await db.db.products.find(query, VERSION_FIELDS).sort(KEYSET_SORT).skip(skip).limit(limit).to_list(length=limit)
+        not_modified = conditional_response(request, response, *page_validators(versions))
+        if not_modified:
+            return not_modified
+    if products is None:
+        products = await db.db.products.find(query).sort(KEYSET_SORT).skip(skip).limit(limit).to_list(length=limit)
+        fill(cache_key, products, token)
+
+    not_modified = conditional_response(request, response, *page_validators(products))
+    if not_modified:
+        return not_modified
+
+    # Any full page can be continued from its last product
+    cursor_after = next_cursor(products, limit)
+    if cursor_after:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_after
+    return render(Product, products, response, many=True)
+
+@router.get("/suggest", response_model=List[ProductSuggestion])
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    current_user: User = Depends(get_current_user)
+):
+    # Serverless workers skip the startup build, so build on first use there
+    if not suggest_index.ready:
+        await build_suggest_index(db.db)
+    return suggest_index.suggest(q, limit)
+
+@router.get("/facets", response_model=List[CategoryFacet])
+async def get_facets(current_user: User = Depends(get_current_user)):
+    # Reads the materialized summary, so cost scales with categories, not products
+    return await db.db.category_facets.find({}, {"applied": 0}).sort("_id", 1).to_list(None)
 
 @router.get("/{product_id}", response_model=Product)
-async def get_product(product_id: str, current_user: User = Depends(get_current_user)):
-    product = await db.db.products.find_one({"_id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
\ No newline at end of file
+async def get_product(
+    product_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    cache_key = ("product", product_id)
+    product = product_cache.get(cache_key)
+    token = fill_token(cache_key)
+    if product is None and wants_revalidation(request):
+        version = await db.db.products.find_one({"_id": product_id}, VERSION_FIELDS)
+        if version:
+            not_modified = conditional_response(request, response, *document_validators(version))
+            if not_modified:
+                return not_modified
+    if product is None:
+        product = await db.db.products.find_one({"_id": product_id})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        fill(cache_key, product, token)
+
+    not_modified = conditional_response(request, response, *document_validators(product))
+    if not_modified:
+        return not_modified
+    return render(Product, product, response)
\ No newline at end of file
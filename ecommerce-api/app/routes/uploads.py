@@ -0,0 +1,116 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from email.utils import formatdate
+from typing import Optional, Tuple
+from app.config import UPLOAD_DIRECTORY, UPLOAD_CHUNK_SIZE
+import mimetypes
+import os
+import re
+
+router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+# Uploads are stored as <sha256><ext> (variants as <sha256>_<name>_<size><ext>)
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(_[a-z0-9_]+)?\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LEGACY_CACHE_CONTROL = "public, max-age=3600"
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range; returns inclusive (start, end) or None if unsatisfiable"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+async def _read_range(path: str, start: int, end: int):
+    handle = await run_in_threadpool(open, path, "rb")
+    try:
+        await run_in_threadpool(handle.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_in_threadpool(handle.read, min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_in_threadpool(handle.close)
+
+@router.api_route("/{filename}", methods=["GET", "HEAD"])
+async def serve_upload(filename: str, request: Request):
+    if filename.startswith(".") or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    path = str(UPLOAD_DIRECTORY / filename)
+    try:
+        stat = await run_in_threadpool(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Content-addressed files get a strong ETag from their hash and never change
+    if CONTENT_ADDRESSED.match(filename):
+        etag = f'"{os.path.splitext(filename)[0]}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        cache_control = LEGACY_CACHE_CONTROL
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+
+    # Only honour Range when If-Range (if any) still matches this representation. Multiple
+    # ranges would need a multipart/byteranges body; RFC 9110 lets us send the whole file instead.
+    if range_header and "," not in range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{stat.st_size}"}
+            )
+
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if request.method == "HEAD":
+            return Response(status_code=206, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            _read_range(path, start, end),
+            status_code=206,
+            headers=headers,
+            media_type=media_type
+        )
+
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat)
@@ -0,0 +1,116 @@
+"""Sales rollups for the admin dashboard, maintained incrementally.
+
+Every order contributes to `order_status_counts`. Orders that are not
+cancelled also contribute to `sales_daily` (keyed by YYYY-MM-DD of
+`created_at`) and `product_sales`. Run `python -m app.utils.analytics` to
+rebuild all three from the orders collection, e.g. after a backfill.
+"""
+from datetime import datetime
+from typing import Dict
+from app.utils.outbox import apply_once, once
+import asyncio
+import sys
+
+CANCELLED = "cancelled"
+
+def _day(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+def _sales_updates(order: Dict, sign: int, event_id: str):
+    units = sum(item["quantity"] for item in order["items"])
+    day = once(
+        _day(order["created_at"]),
+        {
+            "$inc": {"orders": sign, "revenue": sign * order["total"], "units": sign * units},
+            "$setOnInsert": {"date": order["created_at"].replace(hour=0, minute=0, second=0, microsecond=0)}
+        },
+        event_id
+    )
+    # One update per product, since a second one for the same row would look like a redelivery
+    lines: Dict[str, Dict] = {}
+    for item in order["items"]:
+        line = lines.setdefault(item["product_id"], {"name": item["name"], "units": 0, "revenue": 0})
+        line["units"] += item["quantity"]
+        line["revenue"] += item["price"] * item["quantity"]
+    products = [
+        once(
+            product_id,
+            {"$inc": {"units": sign * line["units"], "revenue": sign * line["revenue"]}, "$set": {"name": line["name"]}},
+            event_id
+        )
+        for product_id, line in lines.items()
+    ]
+    return day, products
+
+async def record_order(database, order: Dict, event_id: str, session=None) -> None:
+    """Fold a newly placed order into the rollups"""
+    day, products = _sales_updates(order, 1, event_id)
+    await apply_once(database.sales_daily, [day], session=session)
+    await apply_once(database.product_sales, products, session=session)
+    await apply_once(database.order_status_counts, [once(order["status"], {"$inc": {"count": 1}}, event_id)], session=session)
+
+async def record_status_change(database, order: Dict, new_status: str, event_id: str, session=None) -> None:
+    """Move an order between status buckets; `order` is the document before the change"""
+    old_status = order["status"]
+    if old_status == new_status:
+        return
+
+    await apply_once(database.order_status_counts, [
+        once(old_status, {"$inc": {"count": -1}}, event_id),
+        once(new_status, {"$inc": {"count": 1}}, event_id),
+    ], session=session)
+
+    # Cancelling takes an order out of the sales figures; un-cancelling puts it back
+    if CANCELLED in (old_status, new_status):
+        day, products = _sales_updates(order, -1 if new_status == CANCELLED else 1, event_id)
+        await apply_once(database.sales_daily, [day], session=session)
+        await apply_once(database.product_sales, products, session=session)
+
+async def rebuild_rollups(database) -> None:
+    """Recompute every rollup from scratch; run while checkout traffic is quiet"""
+    await database.orders.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        {"$out": "order_status_counts"},
+    ]).to_list(None)
+
+    await database.orders.aggregate([
+        {"$match": {"status": {"$ne": CANCELLED}}},
+        {
+            "$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                "date": {"$min": {"$dateTrunc": {"date": "$created_at", "unit": "day"}}},
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": "$total"},
+                "units": {"$sum": {"$sum": "$items.quantity"}},
+            }
+        },
+        {"$out": "sales_daily"},
+    ]).to_list(None)
+
+    await database.orders.aggregate([
+        {"$match": {"status": {"$ne": CANCELLED}}},
+        {"$unwind": "$items"},
+        {
+            "$group": {
+                "_id": "$items.product_id",
+                "name": {"$last": "$items.name"},
+                "units": {"$sum": "$items.quantity"},
+                "revenue": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}},
+            }
+        },
+        {"$out": "product_sales"},
+    ]).to_list(None)
+
+async def _main() -> int:
+    from app.database import db, connect_to_mongo, close_mongo_connection
+
+    await connect_to_mongo(create_indexes=False)
+    try:
+        await rebuild_rollups(db.db)
+        print("✅ Rebuilt sales rollups")
+        return 0
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -1,51 +1,167 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Optional
+import asyncio
+import time
+import uuid
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS,
+    USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS,
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+)
 from app.database import db
 from app.models.user import TokenData, User, UserRole
+from app.utils.cache import LRUCache
+from app.utils.metrics import password_hash_duration
+from app.utils.revocation import revoked_tokens, sync_revocations
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+# For routes like logout that also accept anonymous calls
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Users behind legacy tokens (no embedded claims), keyed by token subject (email)
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def invalidate_user(email: str) -> None:
+    """Drop a cached user; call after any write that changes the user document"""
+    user_cache.invalidate(email)
+
+# passlib is imported on first use to keep it out of cold starts
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+async def _run_hash_job(func, *args):
+    global _hash_pending
+    # Shed load instead of queueing behind a login burst
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    _hash_pending += 1
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+
+    def release() -> None:
+        global _hash_pending
+        _hash_pending -= 1
+        password_hash_duration.observe(time.perf_counter() - start, func.__name__)
+
+    # Release when the hash itself finishes: a cancelled request stops waiting, but bcrypt keeps the thread
+    job = _hash_executor.submit(func, *args)
+    job.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+    return await asyncio.wrap_future(job)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hash_job(get_pwd_context().verify, plain_password, hashed_password)
+
+async def get_password_hash(password: str) -> str:
+    return await _run_hash_job(get_pwd_context().hash, password)
+
+def shutdown_password_hashing() -> None:
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
+# python-jose (and the cryptography backend it loads) is also imported on first use
+_jose = None
+
+def get_jose():
+    """Return python-jose's (jwt, JWTError), importing them once"""
+    global _jose
+    if _jose is None:
+        from jose import JWTError, jwt
+        _jose = (jwt, JWTError)
+    return _jose
+
+def user_claims(user: Dict) -> Dict:
+    """Everything needed to rebuild `User` from an access token without a DB read"""
+    return {
+        "sub": user["email"],
+        "uid": user["_id"],
+        "role": user["role"],
+        "name": user["name"],
+        "created_at": user["created_at"].isoformat(),
+    }
 
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
+    jwt, _ = get_jose()
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
+def create_refresh_token(user: Dict) -> str:
+    jwt, _ = get_jose()
+    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {"sub": user["email"], "uid": user["_id"], "exp": expire, "jti": uuid.uuid4().hex, "type": "refresh"}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def credentials_error() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+async def decode_token(token: str, token_type: str = "access") -> Dict:
+    """Verify signature, expiry, type and revocation; raise 401 otherwise"""
+    jwt, JWTError = get_jose()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        role: str = payload.get("role")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email, role=role)
     except JWTError:
+        raise credentials_error()
+
+    # Tokens issued before refresh tokens existed carry no type and count as access tokens
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise credentials_error()
+
+    jti = payload.get("jti")
+    if jti:
+        await sync_revocations(db.db)
+        if jti in revoked_tokens:
+            raise credentials_error()
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    payload = await decode_token(token)
+
+    if "uid" in payload:
+        # Claims were signed by us, so skip validation as well as the DB read
+        return User.model_construct(
+            id=payload["uid"],
+            email=payload["sub"],
+            name=payload["name"],
+            role=UserRole(payload["role"]),
+            created_at=datetime.fromisoformat(payload["created_at"]),
+        )
+
+    credentials_exception = credentials_error()
+    token_data = TokenData(email=payload["sub"], role=payload.get("role"))
+    user = user_cache.get(token_data.email)
+    if user is not None:
+        return user
+
+    user_doc = await db.db.users.find_one({"email": token_data.email})
+    if user_doc is None:
         raise credentials_exception
-        
-    user = await db.db.users.find_one({"email": token_data.email})
-    if user is None:
-        raise credentials_exception
-        
-    return User(**user)
+
+    user = User(**user_doc)
+    user_cache.set(token_data.email, user)
+    return user
 
 async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
     if current_user.role != UserRole.ADMIN:
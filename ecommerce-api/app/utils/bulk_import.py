@@ -0,0 +1,226 @@
+"""Batched product import and bulk update from CSV or NDJSON uploads.
+
+Rows are parsed in the thread pool a batch at a time, validated with the
+product models, and written with one insert_many/bulk_write per batch. Bad
+rows are reported by line number and never abort the rest of the run.
+"""
+from datetime import datetime
+from itertools import islice
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from bson import ObjectId
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.config import BULK_BATCH_SIZE, BULK_MAX_REPORTED_ERRORS
+from app.models.product import ProductCreate, ProductUpdate
+from app.utils.facets import refresh_category_facets
+from app.utils.product_cache import clear_product_cache
+from app.utils.search_index import SUGGEST_FIELDS, suggest_index
+import csv
+import io
+import json
+import time
+
+# Fields whose change has to be reflected in the suggest index
+SUGGEST_KEYS = set(SUGGEST_FIELDS)
+
+Row = Tuple[int, object]
+
+class BulkReport:
+    def __init__(self):
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[Dict] = []
+        self.started = time.perf_counter()
+
+    def error(self, line: int, message: str, product_id: Optional[str] = None) -> None:
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "id": product_id, "error": message})
+
+    def summary(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "batches": self.batches,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.processed / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+def _csv_rows(stream) -> Iterator[Row]:
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, e
+            continue
+        # Empty cells mean "not provided"
+        yield reader.line_num, {key: value for key, value in row.items() if key and value not in ("", None)}
+
+def _ndjson_rows(stream) -> Iterator[Row]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError("Expected a JSON object")
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+
+async def run_bulk(
+    upload_file: UploadFile,
+    file_format: str,
+    write_batch: Callable[[List[Row], BulkReport], Awaitable[None]]
+) -> Dict:
+    """Feed the upload to `write_batch` in BULK_BATCH_SIZE chunks and return the run report"""
+    # UploadFile is already spooled to disk; wrap it so rows are decoded lazily
+    stream = io.TextIOWrapper(upload_file.file, encoding="utf-8-sig", newline="")
+    rows = _csv_rows(stream) if file_format == "csv" else _ndjson_rows(stream)
+    report = BulkReport()
+    try:
+        while batch := await run_in_threadpool(lambda: list(islice(rows, BULK_BATCH_SIZE))):
+            report.processed += len(batch)
+            report.batches += 1
+            parsed = []
+            for line, row in batch:
+                if isinstance(row, Exception):
+                    report.error(line, f"Could not parse row: {row}")
+                else:
+                    parsed.append((line, row))
+            if parsed:
+                await write_batch(parsed, report)
+    finally:
+        stream.detach()
+        await upload_file.close()
+    return report.summary()
+
+async def import_products(database, upload_file: UploadFile, file_format: str) -> Dict:
+    categories: Set[str] = set()
+
+    async def write_batch(rows: List[Row], report: BulkReport) -> None:
+        now = datetime.utcnow()
+        documents, lines = [], []
+        for line, row in rows:
+            try:
+                product = ProductCreate.model_validate(row)
+            except ValidationError as e:
+                report.error(line, _validation_message(e))
+                continue
+            documents.append({"_id": str(ObjectId()), **product.model_dump(), "created_at": now, "updated_at": now})
+            lines.append(line)
+        if not documents:
+            return
+
+        failed = set()
+        try:
+            await database.products.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                report.error(lines[write_error["index"]], write_error.get("errmsg", "Write failed"))
+
+        for index, document in enumerate(documents):
+            if index not in failed:
+                report.succeeded += 1
+                categories.add(document["category"])
+                suggest_index.upsert(document)
+
+    result = await run_bulk(upload_file, file_format, write_batch)
+    await _after_bulk_write(database, categories)
+    return result
+
+async def update_products(database, upload_file: UploadFile, file_format: str) -> Dict:
+    """Apply partial updates keyed by each row's `_id` (or `id`) column"""
+    categories: Set[str] = set()
+
+    async def write_batch(rows: List[Row], report: BulkReport) -> None:
+        updates: Dict[str, Tuple[int, Dict]] = {}
+        for line, row in rows:
+            product_id = row.get("_id") or row.get("id")
+            if not product_id:
+                report.error(line, "Missing _id")
+                continue
+            try:
+                changes = ProductUpdate.model_validate(row).model_dump(exclude_unset=True, exclude_none=True)
+            except ValidationError as e:
+                report.error(line, _validation_message(e), str(product_id))
+                continue
+            if not changes:
+                report.error(line, "No fields to update", str(product_id))
+                continue
+            if str(product_id) in updates:
+                # Later rows for the same product win, as they would with one request per row
+                report.error(updates[str(product_id)][0], "Superseded by a later row", str(product_id))
+            updates[str(product_id)] = (line, changes)
+        if not updates:
+            return
+
+        # One read per batch finds unknown ids and the categories the facets must refresh
+        existing = {
+            product["_id"]: product
+            async for product in database.products.find(
+                {"_id": {"$in": list(updates)}}, {"category": 1, "stock_shards": 1}
+            )
+        }
+        now = datetime.utcnow()
+        operations, written = [], []
+        for product_id, (line, changes) in updates.items():
+            if product_id not in existing:
+                report.error(line, "Product not found", product_id)
+                continue
+            if "stock" in changes and existing[product_id].get("stock_shards"):
+                report.error(line, "Stock is sharded; unshard the product before setting it", product_id)
+                continue
+            operations.append(UpdateOne({"_id": product_id}, {"$set": {**changes, "updated_at": now}}))
+            written.append(product_id)
+        if not operations:
+            return
+
+        failed = set()
+        try:
+            await database.products.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                product_id = written[write_error["index"]]
+                failed.add(product_id)
+                report.error(updates[product_id][0], write_error.get("errmsg", "Write failed"), product_id)
+
+        reindex = []
+        for product_id in written:
+            if product_id in failed:
+                continue
+            report.succeeded += 1
+            changes = updates[product_id][1]
+            if changes.keys() & {"category", "price", "stock"}:
+                categories.add(existing[product_id]["category"])
+                categories.add(changes.get("category", existing[product_id]["category"]))
+            if changes.keys() & SUGGEST_KEYS:
+                reindex.append(product_id)
+
+        if reindex and suggest_index.ready:
+            async for product in database.products.find({"_id": {"$in": reindex}}, SUGGEST_FIELDS):
+                suggest_index.upsert(product)
+
+    result = await run_bulk(upload_file, file_format, write_batch)
+    await _after_bulk_write(database, categories)
+    return result
+
+async def _after_bulk_write(database, categories: Set[str]) -> None:
+    # Cheaper than invalidating thousands of keys one by one
+    clear_product_cache()
+    await refresh_category_facets(database, categories)
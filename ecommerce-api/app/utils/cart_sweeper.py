@@ -0,0 +1,77 @@
+"""Periodic removal of abandoned and empty carts.
+
+Carts untouched for CART_RETENTION_DAYS are deleted, as are empty carts
+(left over from before carts were created lazily) older than
+CART_EMPTY_RETENTION_HOURS. A sweeper is used rather than a TTL index so
+reclaimed documents and bytes can be counted.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pymongo.errors import PyMongoError
+from app.config import (
+    CART_RETENTION_DAYS, CART_EMPTY_RETENTION_HOURS, CART_SWEEP_INTERVAL_MINUTES, CART_SWEEP_BATCH_SIZE
+)
+from app.utils.metrics import carts_reclaimed, carts_reclaimed_bytes
+import asyncio
+
+_sweep_task: Optional[asyncio.Task] = None
+
+async def _sweep(database, reason: str, query: Dict) -> int:
+    reclaimed = 0
+    while True:
+        batch = await database.carts.aggregate([
+            {"$match": query},
+            {"$limit": CART_SWEEP_BATCH_SIZE},
+            {"$project": {"size": {"$bsonSize": "$$ROOT"}}},
+        ]).to_list(None)
+        if not batch:
+            return reclaimed
+
+        # Re-check the filter so a cart touched since the read survives
+        result = await database.carts.delete_many({"_id": {"$in": [cart["_id"] for cart in batch]}, **query})
+        size = sum(cart["size"] for cart in batch)
+        # Carts that escaped deletion are few; scale rather than re-read them
+        carts_reclaimed.inc(reason, amount=result.deleted_count)
+        carts_reclaimed_bytes.inc(reason, amount=size * result.deleted_count // len(batch))
+        reclaimed += result.deleted_count
+        if len(batch) < CART_SWEEP_BATCH_SIZE:
+            return reclaimed
+
+async def sweep_carts(database) -> Dict[str, int]:
+    now = datetime.utcnow()
+    return {
+        "abandoned": await _sweep(database, "abandoned", {
+            "updated_at": {"$lt": now - timedelta(days=CART_RETENTION_DAYS)}
+        }),
+        "empty": await _sweep(database, "empty", {
+            "updated_at": {"$lt": now - timedelta(hours=CART_EMPTY_RETENTION_HOURS)},
+            "items": {"$size": 0},
+        }),
+    }
+
+async def _run_sweeper(database) -> None:
+    while True:
+        try:
+            reclaimed = await sweep_carts(database)
+            if any(reclaimed.values()):
+                print(f"🧹 Reclaimed carts: {reclaimed}")
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            print("❌ Cart sweep error:", e)
+        await asyncio.sleep(CART_SWEEP_INTERVAL_MINUTES * 60)
+
+def start_cart_sweeper(database) -> None:
+    global _sweep_task
+    if _sweep_task is None:
+        _sweep_task = asyncio.create_task(_run_sweeper(database))
+
+async def stop_cart_sweeper() -> None:
+    global _sweep_task
+    if _sweep_task is not None:
+        _sweep_task.cancel()
+        try:
+            await _sweep_task
+        except asyncio.CancelledError:
+            pass
+        _sweep_task = None
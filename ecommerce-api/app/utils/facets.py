@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from app.utils.outbox import apply_once, once
+
+def _facet_pipeline(match: dict) -> List[dict]:
+    return [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": "$category",
+                "product_count": {"$sum": 1},
+                "in_stock_count": {"$sum": {"$cond": [{"$gt": ["$stock", 0]}, 1, 0]}},
+                "min_price": {"$min": "$price"},
+                "max_price": {"$max": "$price"},
+            }
+        },
+    ]
+
+def _in_stock(product: Dict) -> int:
+    return 1 if product.get("stock", 0) > 0 else 0
+
+def in_stock_delta(before: int, after: int) -> int:
+    """+1 if a stock write brought a product back in stock, -1 if it sold out, else 0"""
+    return (1 if after > 0 else 0) - (1 if before > 0 else 0)
+
+async def refresh_category_facets(database, categories: Iterable[str]) -> None:
+    """Recompute the materialized facet rows for just the given categories"""
+    categories = sorted({category for category in categories if category})
+    if not categories:
+        return
+
+    # Uses the (category, created_at, _id) index, so this only reads the affected categories
+    rows = await database.products.aggregate(_facet_pipeline({"category": {"$in": categories}})).to_list(None)
+    now = datetime.utcnow()
+    found = {row["_id"] for row in rows}
+
+    # $set rather than replace, so the row keeps the outbox events it has applied
+    operations = [
+        UpdateOne({"_id": row.pop("_id")}, {"$set": {**row, "updated_at": now}}, upsert=True) for row in rows
+    ]
+    # Categories whose last product went away
+    operations += [DeleteOne({"_id": category}) for category in categories if category not in found]
+    await database.category_facets.bulk_write(operations, ordered=False)
+
+async def add_product_facets(database, product: Dict) -> None:
+    await database.category_facets.update_one(
+        {"_id": product["category"]},
+        {
+            "$inc": {"product_count": 1, "in_stock_count": _in_stock(product)},
+            "$min": {"min_price": product["price"]},
+            "$max": {"max_price": product["price"]},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+
+async def remove_product_facets(database, product: Dict) -> None:
+    row = await database.category_facets.find_one_and_update(
+        {"_id": product["category"]},
+        {
+            "$inc": {"product_count": -1, "in_stock_count": -_in_stock(product)},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    # A price range can't shrink with an update, so recount the category if this product set it
+    if row is None or row["product_count"] <= 0 or product["price"] in (row["min_price"], row["max_price"]):
+        await refresh_category_facets(database, [product["category"]])
+
+async def update_product_facets(database, before: Dict, after: Dict) -> None:
+    """Move a product's contribution from its old state to its new one"""
+    if before["category"] != after["category"]:
+        await remove_product_facets(database, before)
+        await add_product_facets(database, after)
+        return
+
+    update = {"$set": {"updated_at": datetime.utcnow()}}
+    delta = _in_stock(after) - _in_stock(before)
+    if delta:
+        update["$inc"] = {"in_stock_count": delta}
+    price_changed = before["price"] != after["price"]
+    if price_changed:
+        update["$min"] = {"min_price": after["price"]}
+        update["$max"] = {"max_price": after["price"]}
+    if not delta and not price_changed:
+        return
+
+    row = await database.category_facets.find_one_and_update(
+        {"_id": after["category"]}, update, return_document=ReturnDocument.AFTER
+    )
+    if row is None or (price_changed and before["price"] in (row["min_price"], row["max_price"])):
+        await refresh_category_facets(database, [after["category"]])
+
+async def adjust_in_stock(database, deltas: Dict[str, int], event_id: Optional[str] = None) -> None:
+    """Apply per-category in-stock changes; from an outbox handler, pass the event id to apply them once"""
+    updates = {
+        category: {"$inc": {"in_stock_count": delta}, "$set": {"updated_at": datetime.utcnow()}}
+        for category, delta in deltas.items() if delta
+    }
+    if event_id is not None:
+        await apply_once(database.category_facets, [once(category, update, event_id, upsert=False) for category, update in updates.items()])
+    elif updates:
+        await database.category_facets.bulk_write(
+            [UpdateOne({"_id": category}, update) for category, update in updates.items()], ordered=False
+        )
+
+async def rebuild_category_facets(database) -> None:
+    """Full rebuild; run once when the summary is empty or suspected stale"""
+    rows = await database.products.aggregate(_facet_pipeline({})).to_list(None)
+    now = datetime.utcnow()
+    await database.category_facets.delete_many({})
+    if rows:
+        await database.category_facets.insert_many([{**row, "updated_at": now} for row in rows])
+
+async def ensure_category_facets(database) -> None:
+    if await database.category_facets.estimated_document_count() == 0:
+        await rebuild_category_facets(database)
@@ -1,27 +1,158 @@
+import hashlib
 import uuid
 from fastapi import UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from app.config import UPLOAD_DIRECTORY
-import shutil
+from typing import Dict, Optional
+from app.config import UPLOAD_DIRECTORY, MAX_UPLOAD_SIZE_MB, UPLOAD_CHUNK_SIZE, IMAGE_WORKERS, IMAGE_VARIANTS
+import asyncio
 import os
 
-async def save_upload_file(upload_file: UploadFile) -> str:
-    """Save an uploaded file and return the filename"""
+MAX_UPLOAD_SIZE = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+_image_executor: Optional[ProcessPoolExecutor] = None
+
+class ImageRejected(Exception):
+    """Raised by the resize worker for uploads that must not be stored, e.g. decompression bombs"""
+
+def _remove_file(path: Path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def save_upload_file(upload_file: UploadFile) -> Dict[str, str]:
+    """Stream an uploaded file to disk and return URLs for it and its resized variants"""
     if not upload_file.filename:
         raise HTTPException(status_code=400, detail="No file name provided")
-    
-    # Generate unique filename
-    file_extension = Path(upload_file.filename).suffix
-    new_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIRECTORY / new_filename
-    
-    # Save the file
+
+    await run_in_threadpool(UPLOAD_DIRECTORY.mkdir, exist_ok=True)
+
+    # Stream into a temporary file, hashing as we go
+    file_extension = Path(upload_file.filename).suffix.lower()
+    temp_path = UPLOAD_DIRECTORY / f".{uuid.uuid4()}.part"
+    digest = hashlib.sha256()
+
+    # Save the file chunk by chunk, keeping disk writes off the event loop
+    size = 0
+    buffer = await run_in_threadpool(open, temp_path, "wb")
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
+        while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_SIZE_MB} MB limit")
+            digest.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+    except HTTPException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(_remove_file, temp_path)
+        raise
     except Exception as e:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(_remove_file, temp_path)
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     finally:
-        upload_file.file.close()
-    
-    return f"/uploads/{new_filename}"
\ No newline at end of file
+        await upload_file.close()
+    await run_in_threadpool(buffer.close)
+
+    # Store under the content hash; identical uploads share one file
+    new_filename = f"{digest.hexdigest()}{file_extension}"
+    file_path = UPLOAD_DIRECTORY / new_filename
+    await run_in_threadpool(_commit_file, temp_path, file_path)
+
+    try:
+        variants = await generate_image_variants(file_path)
+    except ImageRejected as e:
+        await run_in_threadpool(_remove_file, file_path)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"original": f"/uploads/{new_filename}", **variants}
+
+def _commit_file(temp_path: Path, file_path: Path) -> None:
+    if file_path.exists():
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, file_path)
+
+async def generate_image_variants(file_path: Path) -> Dict[str, str]:
+    """Resize an uploaded image in the worker pool; returns variant name -> URL"""
+    global _image_executor
+    if IMAGE_WORKERS > 0 and _image_executor is None:
+        _image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+
+    loop = asyncio.get_running_loop()
+    filenames = await loop.run_in_executor(_image_executor, _resize_image, str(file_path), IMAGE_VARIANTS)
+    return {name: f"/uploads/{filename}" for name, filename in filenames.items()}
+
+def shutdown_image_workers() -> None:
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=False, cancel_futures=True)
+
+def _save_variant(image, path: Path, image_format: str, **options) -> None:
+    # Write under a temporary name and rename, so a variant is never visible half-written
+    temp_path = path.with_name(f".{uuid.uuid4()}.part")
+    try:
+        image.save(temp_path, image_format, **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        _remove_file(temp_path)
+        raise
+
+def _variant_stem(source: Path, name: str, max_size: int) -> str:
+    return f"{source.stem}_{name}_{max_size}"
+
+def _resize_image(path: str, sizes: Dict[str, int]) -> Dict[str, str]:
+    # Runs in a worker process, so Pillow is imported here rather than at module load
+    try:
+        from PIL import Image, UnidentifiedImageError, features
+    except ImportError:
+        return {}
+
+    source = Path(path)
+    webp = features.check("webp")
+    expected = set(sizes) | ({f"{name}_webp" for name in sizes} if webp else set())
+
+    # Variants of a content-addressed file never change, so reuse them once the full set
+    # is on disk; a set another worker is still writing is regenerated (renames are atomic).
+    # The size is part of the name, so changing IMAGE_*_SIZE produces new variants.
+    existing = {}
+    for name, max_size in sizes.items():
+        stem = _variant_stem(source, name, max_size)
+        for suffix in (".jpg", ".png"):
+            if source.with_name(stem + suffix).exists():
+                existing[name] = stem + suffix
+        if webp and source.with_name(stem + ".webp").exists():
+            existing[f"{name}_webp"] = stem + ".webp"
+    if expected <= existing.keys():
+        return existing
+
+    try:
+        with Image.open(source) as image:
+            image.load()
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    except Image.DecompressionBombError:
+        # Small file, huge declared dimensions; decoding it would exhaust memory
+        raise ImageRejected("Image dimensions are too large")
+    except (UnidentifiedImageError, OSError):
+        # Not an image Pillow can read; keep only the original
+        return {}
+
+    variants = {}
+    for name, max_size in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((max_size, max_size))
+
+        stem = _variant_stem(source, name, max_size)
+        if resized.mode == "RGBA":
+            filename = f"{stem}.png"
+            _save_variant(resized, source.with_name(filename), "PNG", optimize=True)
+        else:
+            filename = f"{stem}.jpg"
+            _save_variant(resized, source.with_name(filename), "JPEG", quality=85, optimize=True, progressive=True)
+        variants[name] = filename
+
+        if webp:
+            webp_filename = f"{stem}.webp"
+            _save_variant(resized, source.with_name(webp_filename), "WEBP", quality=80)
+            variants[f"{name}_webp"] = webp_filename
+    return variants
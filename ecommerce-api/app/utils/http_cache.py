@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import Request, Response
+import hashlib
+
+# Authenticated data: browsers may keep it, but must revalidate before reuse
+CACHE_CONTROL = "private, no-cache"
+# Enough to tell whether a document changed; revalidation queries project only these
+VERSION_FIELDS = {"updated_at": 1}
+
+def _version(doc: Dict) -> str:
+    updated_at = doc.get("updated_at")
+    if updated_at is None:
+        return f"{doc['_id']}:"
+    # Mongo stores milliseconds, so compare at that precision
+    return f"{doc['_id']}:{updated_at.replace(microsecond=updated_at.microsecond // 1000 * 1000).isoformat()}"
+
+def _weak_etag(versions: Iterable[str]) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for version in versions:
+        digest.update(version.encode())
+        digest.update(b"\n")
+    return f'W/"{digest.hexdigest()}"'
+
+def document_validators(doc: Dict) -> Tuple[str, Optional[datetime]]:
+    return _weak_etag([_version(doc)]), doc.get("updated_at")
+
+def page_validators(docs: Iterable[Dict]) -> Tuple[str, Optional[datetime]]:
+    """ETag over the ids and versions of a listing page, plus its newest updated_at"""
+    docs = list(docs)
+    last_modified = max((doc["updated_at"] for doc in docs if doc.get("updated_at")), default=None)
+    return _weak_etag(_version(doc) for doc in docs), last_modified
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> Optional[Response]:
+    """Set validators on `response`; return a 304 if the client's copy is still current"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since
+        matched = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        matched = bool(if_modified_since and last_modified and _not_modified_since(if_modified_since, last_modified))
+    return Response(status_code=304, headers=headers) if matched else None
+
+def wants_revalidation(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
@@ -0,0 +1,149 @@
+"""Idempotency-Key support for retried writes.
+
+The first request with a key claims it in `idempotency_keys` and runs; its
+result is stored there (and in a small LRU) so retries replay it instead of
+re-executing. Duplicates arriving while it runs wait for it: in-process via
+a shared future, across workers by polling the claim. Only successful
+results are stored; a failed attempt releases the key so it can be retried.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict
+from fastapi import HTTPException, Request, Response
+from pymongo.errors import DuplicateKeyError
+from app.config import (
+    IDEMPOTENCY_TTL_HOURS, IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_WAIT_SECONDS, IDEMPOTENCY_CACHE_SIZE
+)
+from app.database import db
+from app.utils.cache import LRUCache
+import asyncio
+import hashlib
+import time
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+_completed = LRUCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_HOURS * 3600)
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def _fingerprint(request: Request) -> str:
+    # The body is already buffered by FastAPI for JSON routes
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{request.url.query}\n".encode())
+    digest.update(await request.body())
+    return digest.hexdigest()
+
+def _record(fingerprint: str, result: Any) -> Dict:
+    if isinstance(result, Response):
+        return {
+            "fingerprint": fingerprint,
+            "content": bytes(result.body),
+            "status_code": result.status_code,
+            "media_type": result.media_type,
+        }
+    return {"fingerprint": fingerprint, "data": result}
+
+def _replay(record: Dict, fingerprint: str, response: Response) -> Any:
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+    if "content" in record:
+        return Response(
+            content=record["content"],
+            status_code=record["status_code"],
+            media_type=record["media_type"],
+            headers={REPLAYED_HEADER: "true"}
+        )
+    response.headers[REPLAYED_HEADER] = "true"
+    return record["data"]
+
+async def _claim(record_id: str, fingerprint: str):
+    """Return None once this worker owns the key, or the stored record if another run finished"""
+    collection = db.db.idempotency_keys
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = datetime.utcnow()
+        try:
+            await collection.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                "expires_at": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        existing = await collection.find_one({"_id": record_id})
+        if existing is None:
+            # Expired between our insert and read
+            continue
+        if existing["status"] == "done":
+            return existing
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+
+        # Take over claims left behind by a worker that died mid-request
+        taken = await collection.find_one_and_update(
+            {"_id": record_id, "status": "in_progress", "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}}
+        )
+        if taken:
+            return None
+        if time.monotonic() > deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"}
+            )
+        await asyncio.sleep(0.1)
+
+async def idempotent(
+    request: Request,
+    response: Response,
+    user_id: str,
+    operation: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Run `operation` at most once per (user, Idempotency-Key); without the header just run it"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return await operation()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is too long")
+
+    record_id = f"{user_id}:{key}"
+    fingerprint = await _fingerprint(request)
+
+    record = _completed.get(record_id)
+    if record is not None:
+        return _replay(record, fingerprint, response)
+
+    inflight = _inflight.get(record_id)
+    if inflight is not None:
+        # Shield so a disconnecting duplicate doesn't cancel the original request
+        return _replay(await asyncio.shield(inflight), fingerprint, response)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[record_id] = future
+    owned = False
+    try:
+        record = await _claim(record_id, fingerprint)
+        if record is None:
+            owned = True
+            result = await operation()
+            record = _record(fingerprint, result)
+            await db.db.idempotency_keys.update_one(
+                {"_id": record_id}, {"$set": {**record, "status": "done"}, "$unset": {"locked_until": ""}}
+            )
+        future.set_result(record)
+    except BaseException as e:
+        if owned:
+            await db.db.idempotency_keys.delete_one({"_id": record_id, "status": "in_progress"})
+        future.set_exception(e)
+        # Waiters re-raise it; mark it retrieved so an unawaited future doesn't log a warning
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(record_id, None)
+
+    _completed.set(record_id, record)
+    return result if owned else _replay(record, fingerprint, response)
@@ -0,0 +1,339 @@
+"""Sharded stock and cart reservations for hot products.
+
+A sharded product keeps its sellable stock in N `stock_shards` documents
+instead of `products.stock`, so concurrent buyers decrement different
+documents. Adding it to a cart takes a `reservations` hold from a random
+shard; checkout consumes the hold, and removing the item or letting the hold
+pass `expires_at` returns it. `products.stock` becomes a view of the shard
+totals, refreshed by the background reconciler.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from app.config import RESERVATION_TTL_SECONDS, INVENTORY_SWEEP_SECONDS
+from app.utils.facets import adjust_in_stock, in_stock_delta
+from app.utils.metrics import inventory_reservations
+from app.utils.product_cache import invalidate_product
+import asyncio
+import random
+
+# Re-read shard levels this many times when concurrent buyers win the race for them
+TAKE_ATTEMPTS = 3
+SWEEP_BATCH_SIZE = 1000
+# How long a shard request holds its product before another may take it over
+SHARD_CLAIM_SECONDS = 60
+
+_worker_task: Optional[asyncio.Task] = None
+
+def _shard_id(product_id: str, shard: int) -> str:
+    return f"{product_id}:{shard}"
+
+async def shard_product_stock(database, product_id: str, shards: int) -> Dict:
+    """Move a product's stock into `shards` counters; returns the updated product"""
+    # Claim the product before writing shards, so concurrent requests can't clear each other's.
+    # A claim outlives its attempt only if that attempt died; it can be taken over once it lapses.
+    attempt = str(ObjectId())
+    now = datetime.utcnow()
+    product = await database.products.find_one_and_update(
+        {
+            "_id": product_id,
+            "stock_shards": {"$exists": False},
+            "$or": [{"sharding": {"$exists": False}}, {"sharding.until": {"$lt": now}}],
+        },
+        {"$set": {"sharding": {"attempt": attempt, "until": now + timedelta(seconds=SHARD_CLAIM_SECONDS)}}},
+        return_document=ReturnDocument.AFTER
+    )
+    if product is None:
+        raise HTTPException(status_code=409, detail="Product not found, already sharded or being sharded")
+
+    try:
+        # With the claim held, pending shards from other attempts are leftovers of one that died midway
+        await database.stock_shards.delete_many({"product_id": product_id, "pending": {"$exists": True}})
+        for _ in range(TAKE_ATTEMPTS):
+            sharded = await _shard_attempt(database, product, shards, attempt)
+            if sharded is not None:
+                return sharded
+            product = await database.products.find_one({"_id": product_id, "sharding.attempt": attempt})
+            if product is None:
+                raise HTTPException(status_code=409, detail="Sharding took too long and was taken over; retry")
+    except BaseException:
+        await database.products.update_one({"_id": product_id, "sharding.attempt": attempt}, {"$unset": {"sharding": ""}})
+        raise
+
+    await database.products.update_one({"_id": product_id, "sharding.attempt": attempt}, {"$unset": {"sharding": ""}})
+    raise HTTPException(status_code=409, detail="Stock kept changing while sharding; retry shortly")
+
+async def _shard_attempt(database, product: Dict, shards: int, attempt: str) -> Optional[Dict]:
+    """Write pending shards for the current stock and flip the product; None if the stock moved meanwhile"""
+    product_id = product["_id"]
+    pending = {"product_id": product_id, "pending": attempt}
+    # Shards go in first, marked pending, so a failure before the flip leaves products.stock intact
+    base, extra = divmod(product["stock"], shards)
+    try:
+        await database.stock_shards.insert_many([
+            {
+                "_id": _shard_id(product_id, shard),
+                "product_id": product_id,
+                "available": base + (1 if shard < extra else 0),
+                "pending": attempt,
+            }
+            for shard in range(shards)
+        ])
+    except PyMongoError as e:
+        await database.stock_shards.delete_many(pending)
+        if isinstance(e, DuplicateKeyError):
+            # Live shards belong to an unshard still folding them back, pending ones to a lapsed attempt still writing
+            raise HTTPException(status_code=409, detail="Product is being unsharded or resharded; retry shortly")
+        raise
+
+    # A checkout since the read fails the stock guard and we start over, rather than counting its units twice.
+    # products.stock already equals the shard total, so it is left as it is.
+    try:
+        sharded = await database.products.find_one_and_update(
+            {"_id": product_id, "sharding.attempt": attempt, "stock": product["stock"]},
+            {"$set": {"stock_shards": shards, "updated_at": datetime.utcnow()}, "$unset": {"sharding": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+    except PyMongoError:
+        # The flip may still have been applied; only drop the shards if it wasn't
+        if await database.products.find_one({"_id": product_id, "stock_shards": {"$exists": True}}, {"_id": 1}):
+            await database.stock_shards.update_many(pending, {"$unset": {"pending": ""}})
+        else:
+            await database.stock_shards.delete_many(pending)
+        raise
+    if sharded is not None:
+        await database.stock_shards.update_many(pending, {"$unset": {"pending": ""}})
+        return sharded
+    await database.stock_shards.delete_many(pending)
+    return None
+
+async def unshard_product_stock(database, product_id: str) -> Dict:
+    """Fold the shards back into `products.stock`; outstanding holds return there on release"""
+    # Unflag first so holds released meanwhile go to products.stock, then add the shards with $inc
+    product = await database.products.find_one_and_update(
+        {"_id": product_id, "stock_shards": {"$exists": True}},
+        {"$set": {"stock": 0, "updated_at": datetime.utcnow()}, "$unset": {"stock_shards": ""}}
+    )
+    if product is None:
+        raise HTTPException(status_code=409, detail="Product not found or not sharded")
+    await adjust_in_stock(database, {product["category"]: in_stock_delta(product["stock"], 0)})
+
+    total = 0
+    async for shard in database.stock_shards.find({"product_id": product_id}, {"_id": 1}):
+        removed = await database.stock_shards.find_one_and_delete({"_id": shard["_id"]})
+        if removed:
+            total += removed["available"]
+
+    product = await database.products.find_one_and_update(
+        {"_id": product_id},
+        {"$inc": {"stock": total}, "$set": {"updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    await adjust_in_stock(database, {product["category"]: in_stock_delta(product["stock"] - total, product["stock"])})
+    invalidate_product(product_id, [product["category"]])
+    return product
+
+async def _take(database, product_id: str, shards: int, quantity: int) -> Optional[List[Dict]]:
+    """Decrement shards by `quantity` in total; returns the allocations or None if sold out"""
+    allocations = await _take_from_shards(database, product_id, shards, quantity)
+    # Expired holds keep their stock until swept, and nothing sweeps in the background on
+    # serverless; release this product's before calling it sold out
+    if allocations is None and await sweep_expired(database, product_id):
+        allocations = await _take_from_shards(database, product_id, shards, quantity)
+    return allocations
+
+async def _take_from_shards(database, product_id: str, shards: int, quantity: int) -> Optional[List[Dict]]:
+    # Common case: a random shard covers the whole quantity in one write
+    shard_id = _shard_id(product_id, random.randrange(shards))
+    result = await database.stock_shards.update_one(
+        {"_id": shard_id, "available": {"$gte": quantity}},
+        {"$inc": {"available": -quantity}}
+    )
+    if result.modified_count:
+        return [{"shard_id": shard_id, "quantity": quantity}]
+
+    # Otherwise gather from the fullest shards, retrying if others drain them first
+    allocations, remaining = [], quantity
+    for _ in range(TAKE_ATTEMPTS):
+        levels = await database.stock_shards.find(
+            {"product_id": product_id, "available": {"$gt": 0}}
+        ).sort("available", -1).to_list(None)
+        if sum(shard["available"] for shard in levels) < remaining:
+            break
+        for shard in levels:
+            take = min(shard["available"], remaining)
+            result = await database.stock_shards.update_one(
+                {"_id": shard["_id"], "available": {"$gte": take}},
+                {"$inc": {"available": -take}}
+            )
+            if result.modified_count:
+                allocations.append({"shard_id": shard["_id"], "quantity": take})
+                remaining -= take
+                if not remaining:
+                    return allocations
+
+    await give_back(database, product_id, allocations)
+    return None
+
+async def give_back(database, product_id: str, allocations: List[Dict]) -> None:
+    for allocation in allocations:
+        result = await database.stock_shards.update_one(
+            {"_id": allocation["shard_id"]}, {"$inc": {"available": allocation["quantity"]}}
+        )
+        if not result.matched_count:
+            # The product was unsharded while this stock was held
+            product = await database.products.find_one_and_update(
+                {"_id": product_id},
+                {"$inc": {"stock": allocation["quantity"]}, "$set": {"updated_at": datetime.utcnow()}},
+                projection={"stock": 1, "category": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if product:
+                delta = in_stock_delta(product["stock"] - allocation["quantity"], product["stock"])
+                await adjust_in_stock(database, {product["category"]: delta})
+
+async def reserve(database, user_id: str, product_id: str, shards: int, quantity: int) -> Dict:
+    allocations = await _take(database, product_id, shards, quantity)
+    if allocations is None:
+        inventory_reservations.inc("rejected")
+        raise HTTPException(status_code=400, detail="Not enough stock available")
+
+    now = datetime.utcnow()
+    reservation = {
+        "_id": str(ObjectId()),
+        "user_id": user_id,
+        "product_id": product_id,
+        "quantity": quantity,
+        "allocations": allocations,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=RESERVATION_TTL_SECONDS),
+    }
+    try:
+        await database.reservations.insert_one(reservation)
+    except PyMongoError:
+        await give_back(database, product_id, allocations)
+        raise
+    inventory_reservations.inc("reserved")
+    return reservation
+
+async def release(database, user_id: str, product_id: Optional[str] = None) -> None:
+    """Return a user's holds (for one product, or all of them) to the shards"""
+    query = {"user_id": user_id}
+    if product_id:
+        query["product_id"] = product_id
+    async for reservation in database.reservations.find(query, {"_id": 1}):
+        await cancel_reservation(database, reservation["_id"])
+
+async def cancel_reservation(database, reservation_id: str) -> None:
+    # Whoever deletes the hold (release, sweeper or checkout) owns its stock
+    removed = await database.reservations.find_one_and_delete({"_id": reservation_id})
+    if removed:
+        await give_back(database, removed["product_id"], removed["allocations"])
+        inventory_reservations.inc("released")
+
+async def consume(database, user_id: str, product_id: str, shards: Optional[int], quantity: int) -> List[Dict]:
+    """Turn a user's holds into sold stock for checkout; returns allocations for rollback"""
+    owned: List[Dict] = []
+    held = 0
+    async for reservation in database.reservations.find({"user_id": user_id, "product_id": product_id}):
+        if held >= quantity:
+            break
+        if (await database.reservations.delete_one({"_id": reservation["_id"]})).deleted_count:
+            owned.extend(reservation["allocations"])
+            held += reservation["quantity"]
+            inventory_reservations.inc("consumed")
+
+    if held < quantity:
+        # Holds expired or were never taken; buy the shortfall directly
+        extra = await _take(database, product_id, shards, quantity - held) if shards else None
+        if extra is None:
+            await give_back(database, product_id, owned)
+            raise HTTPException(status_code=400, detail="Not enough stock for one or more products")
+        owned.extend(extra)
+    elif held > quantity:
+        # The last hold overshot; hand the difference back from its allocations
+        surplus, returned = held - quantity, []
+        while surplus:
+            allocation = owned.pop()
+            back = min(allocation["quantity"], surplus)
+            returned.append({"shard_id": allocation["shard_id"], "quantity": back})
+            if back < allocation["quantity"]:
+                owned.append({**allocation, "quantity": allocation["quantity"] - back})
+            surplus -= back
+        await give_back(database, product_id, returned)
+    return owned
+
+async def sweep_expired(database, product_id: Optional[str] = None) -> int:
+    """Return expired holds (of one product, or any) to the shards"""
+    query = {"expires_at": {"$lte": datetime.utcnow()}}
+    if product_id:
+        query["product_id"] = product_id
+    expired = await database.reservations.find(query, {"_id": 1}).limit(SWEEP_BATCH_SIZE).to_list(SWEEP_BATCH_SIZE)
+
+    swept = 0
+    for reservation in expired:
+        removed = await database.reservations.find_one_and_delete({"_id": reservation["_id"]})
+        if removed:
+            await give_back(database, removed["product_id"], removed["allocations"])
+            swept += 1
+    if swept:
+        inventory_reservations.inc("expired", amount=swept)
+    return swept
+
+async def reconcile_stock(database, product_id: Optional[str] = None) -> None:
+    """Write the shard totals back to products.stock so listings show what is left"""
+    pipeline = [{"$group": {"_id": "$product_id", "stock": {"$sum": "$available"}}}]
+    if product_id:
+        pipeline.insert(0, {"$match": {"product_id": product_id}})
+    totals = {total["_id"]: total["stock"] for total in await database.stock_shards.aggregate(pipeline).to_list(None)}
+    if not totals:
+        return
+
+    stale = [
+        product["_id"] async for product in database.products.find(
+            {"_id": {"$in": list(totals)}, "stock_shards": {"$exists": True}}, {"stock": 1}
+        )
+        if product["stock"] != totals[product["_id"]]
+    ]
+    # One write per changed product, so each reports the level it replaced for the facet counts
+    deltas: Dict[str, int] = {}
+    for product_id in stale:
+        product = await database.products.find_one_and_update(
+            {"_id": product_id, "stock_shards": {"$exists": True}, "stock": {"$ne": totals[product_id]}},
+            {"$set": {"stock": totals[product_id], "updated_at": datetime.utcnow()}},
+            projection={"stock": 1, "category": 1}
+        )
+        if product:
+            deltas[product["category"]] = deltas.get(product["category"], 0) + in_stock_delta(product["stock"], totals[product_id])
+            invalidate_product(product_id, [product["category"]])
+    await adjust_in_stock(database, deltas)
+
+async def _maintain_inventory(database) -> None:
+    while True:
+        try:
+            await sweep_expired(database)
+            await reconcile_stock(database)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Keep the loop alive; a dead sweeper would strand every expired hold
+            print("❌ Inventory maintenance error:", repr(e))
+        await asyncio.sleep(INVENTORY_SWEEP_SECONDS)
+
+def start_inventory_worker(database) -> None:
+    global _worker_task
+    if _worker_task is None:
+        _worker_task = asyncio.create_task(_maintain_inventory(database))
+
+async def stop_inventory_worker() -> None:
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
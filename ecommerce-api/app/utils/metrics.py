@@ -0,0 +1,284 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import monitoring
+import threading
+import time
+
+# Seconds; tuned for API latencies from sub-millisecond cache hits up to slow bcrypt/Mongo calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry: List["_Metric"] = []
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def samples(self) -> Dict[Tuple[str, ...], object]:
+        with _lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1, floor: Optional[float] = None) -> None:
+        with _lock:
+            value = self._values.get(labels, 0) - amount
+            self._values[labels] = value if floor is None else max(value, floor)
+
+    def set(self, value: float, *labels: str) -> None:
+        with _lock:
+            self._values[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {state[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# HTTP metrics
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"]
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served", ["method"])
+
+# MongoDB command metrics
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command",
+    ["collection", "command"]
+)
+mongo_command_documents = Counter(
+    "mongodb_command_documents_total", "Documents returned or affected by MongoDB commands",
+    ["collection", "command"]
+)
+mongo_command_failures = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ["collection", "command"]
+)
+
+# MongoDB connection pool metrics
+mongo_pool_connections = Gauge("mongodb_pool_connections", "Open pooled connections", ["address"])
+mongo_pool_checked_out = Gauge("mongodb_pool_checked_out", "Pooled connections currently in use", ["address"])
+mongo_pool_waiting = Gauge("mongodb_pool_waiting", "Operations waiting to check out a connection", ["address"])
+mongo_pool_checkout_failures = Counter(
+    "mongodb_pool_checkout_failures_total", "Failed connection checkouts", ["address", "reason"]
+)
+mongo_pool_cleared = Counter("mongodb_pool_cleared_total", "Times a pool was cleared", ["address"])
+
+# Password hashing metrics
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify latency including pool queueing", ["operation"]
+)
+
+# Inventory metrics
+inventory_reservations = Counter(
+    "inventory_reservations_total", "Hot-product stock holds by outcome", ["outcome"]
+)
+
+# Outbox metrics
+outbox_events = Counter("outbox_events_total", "Outbox events processed by type and outcome", ["type", "outcome"])
+outbox_event_lag = Histogram(
+    "outbox_event_lag_seconds", "Time from enqueue to successful processing", ["type"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+outbox_queue_depth = Gauge("outbox_queue_depth", "Outbox events not yet done, by status", ["status"])
+
+# Cart retention metrics
+carts_reclaimed = Counter("carts_reclaimed_total", "Carts deleted by the sweeper", ["reason"])
+carts_reclaimed_bytes = Counter(
+    "carts_reclaimed_bytes_total", "BSON bytes of carts deleted by the sweeper", ["reason"]
+)
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the shared scope; label by its
+            # template rather than the raw path to keep cardinality bounded
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            http_request_duration.observe(time.perf_counter() - start, method, route, str(status_code[0]))
+            http_requests_in_flight.dec(method)
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records per-collection, per-command durations and document counts"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple, Tuple[str, str]] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else "-"
+        self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def succeeded(self, event):
+        key = self._pending.pop((event.connection_id, event.request_id), None)
+        if key is None:
+            return
+        mongo_command_duration.observe(event.duration_micros / 1e6, *key)
+
+        reply = event.reply
+        if "cursor" in reply:
+            batch = reply["cursor"].get("firstBatch", reply["cursor"].get("nextBatch", []))
+            documents = len(batch)
+        else:
+            documents = reply.get("n", 0)
+        if documents:
+            mongo_command_documents.inc(*key, amount=documents)
+
+    def failed(self, event):
+        key = self._pending.pop((event.connection_id, event.request_id), None)
+        if key is None:
+            return
+        mongo_command_duration.observe(event.duration_micros / 1e6, *key)
+        mongo_command_failures.inc(*key)
+
+mongo_command_listener = MongoCommandListener()
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Tracks pool utilization so maxPoolSize and wait-queue settings can be tuned"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        mongo_pool_cleared.inc(_address(event))
+
+    def pool_closed(self, event):
+        # Close and check-in events for this pool can still follow, so decrements below clamp at zero
+        address = _address(event)
+        mongo_pool_connections.set(0, address)
+        mongo_pool_checked_out.set(0, address)
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(_address(event), floor=0)
+
+    def connection_check_out_started(self, event):
+        mongo_pool_waiting.inc(_address(event))
+
+    def connection_check_out_failed(self, event):
+        address = _address(event)
+        mongo_pool_waiting.dec(address, floor=0)
+        mongo_pool_checkout_failures.inc(address, str(event.reason))
+
+    def connection_checked_out(self, event):
+        address = _address(event)
+        mongo_pool_waiting.dec(address, floor=0)
+        mongo_pool_checked_out.inc(address)
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(_address(event), floor=0)
+
+mongo_pool_listener = MongoPoolListener()
+
+def pool_stats() -> Dict[str, Dict[str, float]]:
+    stats: Dict[str, Dict[str, float]] = {}
+    for name, gauge in (
+        ("connections", mongo_pool_connections),
+        ("checked_out", mongo_pool_checked_out),
+        ("waiting", mongo_pool_waiting),
+    ):
+        for (address,), value in gauge.samples().items():
+            stats.setdefault(address, {})[name] = value
+    return stats
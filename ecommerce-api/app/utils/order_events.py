@@ -0,0 +1,30 @@
+"""Side effects of order events, run by the outbox workers rather than the request.
+
+Importing this module registers the handlers; add new ones (emails, webhooks)
+here with `@handles`.
+"""
+from collections import Counter
+from typing import Dict
+from app.utils.analytics import record_order, record_status_change
+from app.utils.facets import adjust_in_stock
+from app.utils.outbox import embeds_events, handles
+
+ORDER_PLACED = "order.placed"
+ORDER_STATUS_CHANGED = "order.status_changed"
+
+# Order writes embed their events, so they need no transaction
+embeds_events("orders")
+
+@handles(ORDER_PLACED)
+async def update_sales_rollups(database, payload: Dict, event_id: str) -> None:
+    await record_order(database, payload["order"], event_id)
+
+@handles(ORDER_PLACED)
+async def count_sold_out_facets(database, payload: Dict, event_id: str) -> None:
+    # Checkout only changes facets when a product sells out; it lists one category per such product
+    sold_out = Counter(payload.get("sold_out_categories", []))
+    await adjust_in_stock(database, {category: -count for category, count in sold_out.items()}, event_id)
+
+@handles(ORDER_STATUS_CHANGED)
+async def move_status_rollups(database, payload: Dict, event_id: str) -> None:
+    await record_status_change(database, payload["order"], payload["status"], event_id)
@@ -0,0 +1,264 @@
+"""Transactional outbox for side effects that shouldn't run on the request path.
+
+Routes write an event in the same operation as the change that caused it:
+either `enqueue` inside the change's transaction, or `new_event` embedded
+in the changed document under PENDING_EVENTS, which `relay` then moves to
+the outbox. A pool of asyncio workers claims due events
+in batches, runs the handlers registered for each type, and retries
+failures with exponential backoff. Delivery is at-least-once: handlers that
+already succeeded for an event are skipped on retry, but one interrupted
+mid-run may run again. Handlers that $inc counters make those updates with
+`once` and `apply_once` so a repeat run doesn't count the event twice.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import ObjectId
+from app.config import (
+    OUTBOX_WORKERS, OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS, OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS, OUTBOX_RETRY_MAX_SECONDS
+)
+from app.utils.metrics import outbox_events, outbox_event_lag, outbox_queue_depth
+import asyncio
+import random
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+# How often the queue depth gauges are refreshed
+DEPTH_REPORT_SECONDS = 15
+# Field holding events embedded in the document whose write caused them
+PENDING_EVENTS = "pending_events"
+# Event ids each `once`-guarded document remembers; a repeat run is skipped as
+# long as fewer than this many newer events reached the document first
+APPLIED_EVENTS_KEPT = 1000
+
+Handler = Callable[[object, Dict, str], Awaitable[None]]
+_handlers: Dict[str, List[Handler]] = {}
+
+# Collections whose documents may carry embedded events; drain relays them
+_event_sources: List[str] = []
+
+_wakeup: Optional[asyncio.Event] = None
+_worker_tasks: List[asyncio.Task] = []
+
+def handles(event_type: str):
+    """Register an async `handler(database, payload, event_id)` for an event type"""
+    def register(handler: Handler) -> Handler:
+        _handlers.setdefault(event_type, []).append(handler)
+        return handler
+    return register
+
+def new_event(event_type: str, payload: Dict) -> Dict:
+    now = datetime.utcnow()
+    return {
+        "_id": str(ObjectId()),
+        "type": event_type,
+        "payload": payload,
+        "status": PENDING,
+        "attempts": 0,
+        "completed_handlers": [],
+        "available_at": now,
+        "created_at": now,
+    }
+
+async def enqueue(database, event_type: str, payload: Dict, session=None) -> None:
+    """Store an event; with a session, call `notify` once its transaction has committed"""
+    await database.outbox.insert_one(new_event(event_type, payload), session=session)
+    # Inside a transaction the event isn't visible to the workers until commit
+    if session is None:
+        notify()
+
+def notify() -> None:
+    """Wake idle workers in this process to pick up newly committed events"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+def embeds_events(collection_name: str) -> None:
+    """Have drain relay events embedded in this collection's documents"""
+    if collection_name not in _event_sources:
+        _event_sources.append(collection_name)
+
+async def relay(database, collection_name: str, document_id=None) -> int:
+    """Move embedded events into the outbox; safe to run concurrently and to repeat"""
+    collection = database[collection_name]
+    query = {f"{PENDING_EVENTS}._id": {"$exists": True}}
+    if document_id is not None:
+        query["_id"] = document_id
+
+    moved = 0
+    async for document in collection.find(query, {PENDING_EVENTS: 1}).limit(OUTBOX_BATCH_SIZE):
+        for event in document[PENDING_EVENTS]:
+            try:
+                await database.outbox.insert_one(event)
+            except DuplicateKeyError:
+                # Relayed before, but the $pull below didn't happen
+                pass
+            await collection.update_one({"_id": document["_id"]}, {"$pull": {PENDING_EVENTS: {"_id": event["_id"]}}})
+            moved += 1
+    if moved:
+        notify()
+    return moved
+
+async def relay_now(database, collection_name: str, document_id) -> None:
+    """Relay right after the write; a failure is left to drain, since the event is already stored"""
+    try:
+        await relay(database, collection_name, document_id)
+    except Exception as e:
+        print(f"❌ Outbox relay for {collection_name} {document_id} failed, leaving it to the workers:", repr(e))
+
+def once(key, update: Dict, event_id: str, upsert: bool = True) -> UpdateOne:
+    """An update of document `key` that is skipped if `event_id` was already applied to it"""
+    return UpdateOne(
+        {"_id": key, "applied": {"$ne": event_id}},
+        {**update, "$push": {"applied": {"$each": [event_id], "$slice": -APPLIED_EVENTS_KEPT}}},
+        upsert=upsert
+    )
+
+async def apply_once(collection, operations: List[UpdateOne], session=None) -> None:
+    """Run `once` updates, treating documents that already applied the event as done"""
+    for _ in range(2):
+        if not operations:
+            return
+        try:
+            await collection.bulk_write(operations, ordered=False, session=session)
+            return
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            # An upsert whose guard missed hit an existing document: either it already applied
+            # this event, or another writer created it meanwhile. One retry tells them apart.
+            operations = [operations[error["index"]] for error in errors]
+
+async def _claim_batch(database) -> List[Dict]:
+    """Lease up to OUTBOX_BATCH_SIZE due events; leases that lapse make events due again"""
+    now = datetime.utcnow()
+    due = {"status": {"$in": [PENDING, PROCESSING]}, "available_at": {"$lte": now}}
+    ids = [
+        event["_id"] async for event in
+        database.outbox.find(due, {"_id": 1}).sort("available_at", 1).limit(OUTBOX_BATCH_SIZE)
+    ]
+    if not ids:
+        return []
+
+    lease = str(ObjectId())
+    await database.outbox.update_many(
+        {"_id": {"$in": ids}, **due},
+        {"$set": {"status": PROCESSING, "lease": lease, "available_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+    )
+    # Other workers may have won some of these; only process what this lease holds.
+    # Reading back by _id keeps this on the primary key rather than scanning for the lease.
+    return await database.outbox.find({"_id": {"$in": ids}, "lease": lease}).to_list(None)
+
+def _backoff(attempts: int) -> float:
+    delay = min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+async def _process(database, event: Dict) -> None:
+    completed = set(event.get("completed_handlers", []))
+    try:
+        for handler in _handlers.get(event["type"], []):
+            name = f"{handler.__module__}.{handler.__qualname__}"
+            if name in completed:
+                continue
+            await handler(database, event["payload"], event["_id"])
+            await database.outbox.update_one(
+                {"_id": event["_id"], "lease": event["lease"]}, {"$addToSet": {"completed_handlers": name}}
+            )
+    except Exception as e:
+        attempts = event["attempts"] + 1
+        failed = attempts >= OUTBOX_MAX_ATTEMPTS
+        await database.outbox.update_one(
+            {"_id": event["_id"], "lease": event["lease"]},
+            {
+                "$set": {
+                    "status": FAILED if failed else PENDING,
+                    "attempts": attempts,
+                    "available_at": datetime.utcnow() + timedelta(seconds=_backoff(attempts)),
+                    "last_error": repr(e),
+                },
+                "$unset": {"lease": ""}
+            }
+        )
+        outbox_events.inc(event["type"], "failed" if failed else "retried")
+        print(f"❌ Outbox {event['type']} {event['_id']} attempt {attempts} failed:", e)
+        return
+
+    now = datetime.utcnow()
+    await database.outbox.update_one(
+        {"_id": event["_id"], "lease": event["lease"]},
+        {"$set": {"status": DONE, "completed_at": now}, "$unset": {"lease": "", "available_at": ""}}
+    )
+    outbox_events.inc(event["type"], "done")
+    outbox_event_lag.observe((now - event["created_at"]).total_seconds(), event["type"])
+
+async def drain(database, max_batches: int = 1) -> int:
+    """Process due events inline; used by the workers and by on-demand draining"""
+    for collection_name in _event_sources:
+        await relay(database, collection_name)
+    processed = 0
+    for _ in range(max_batches):
+        batch = await _claim_batch(database)
+        if not batch:
+            break
+        for event in batch:
+            await _process(database, event)
+        processed += len(batch)
+    return processed
+
+async def outbox_stats(database) -> Dict[str, int]:
+    counts = {status: 0 for status in (PENDING, PROCESSING, FAILED)}
+    async for row in database.outbox.aggregate([
+        {"$match": {"status": {"$in": list(counts)}}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]):
+        counts[row["_id"]] = row["count"]
+    for status, count in counts.items():
+        outbox_queue_depth.set(count, status)
+    return counts
+
+async def _run_worker(database) -> None:
+    while True:
+        try:
+            if await drain(database):
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Handler errors are recorded per event; anything reaching here must not kill the worker
+            print("❌ Outbox worker error:", repr(e))
+
+        # Idle: sleep until the next poll or until a new event is enqueued in this process
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def _report_depth(database) -> None:
+    while True:
+        try:
+            await outbox_stats(database)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("❌ Outbox stats error:", repr(e))
+        await asyncio.sleep(DEPTH_REPORT_SECONDS)
+
+def start_outbox_workers(database) -> None:
+    global _wakeup
+    if _worker_tasks:
+        return
+    _wakeup = asyncio.Event()
+    _worker_tasks.extend(asyncio.create_task(_run_worker(database)) for _ in range(OUTBOX_WORKERS))
+    _worker_tasks.append(asyncio.create_task(_report_depth(database)))
+
+async def stop_outbox_workers() -> None:
+    for task in _worker_tasks:
+        task.cancel()
+    # Events being processed keep their lease and are picked up again after it lapses
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
@@ -0,0 +1,48 @@
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import base64
+import json
+
+from pymongo import DESCENDING
+
+# Keyset ordering shared by every cursor-paginated listing
+KEYSET_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(doc: Dict) -> str:
+    """Build an opaque cursor pointing just after the given document"""
+    payload = json.dumps({"c": doc["created_at"].isoformat(), "i": doc["_id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["c"]), str(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def apply_cursor(query: Dict, cursor: Optional[str]) -> Dict:
+    """Restrict a query to documents that sort after the cursor"""
+    if not cursor:
+        return query
+
+    created_at, doc_id = decode_cursor(cursor)
+    keyset = {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": doc_id}},
+        ]
+    }
+    # Merge at the top level so operators like $text keep working
+    if "$or" in query:
+        return {"$and": [query, keyset]}
+    return {**query, **keyset}
+
+def next_cursor(docs: List[Dict], limit: int) -> Optional[str]:
+    # A short page means there is nothing left to fetch
+    if len(docs) < limit:
+        return None
+    return encode_cursor(docs[-1])
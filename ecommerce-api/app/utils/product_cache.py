@@ -0,0 +1,165 @@
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from bson import encode
+from pymongo.errors import OperationFailure, PyMongoError
+from app.config import (
+    PRODUCT_CACHE_SIZE, PRODUCT_CACHE_MAX_MB, PRODUCT_CACHE_TTL_SECONDS,
+    PRODUCT_CACHE_UNWATCHED_TTL_SECONDS, PRODUCT_CACHE_WATCH,
+)
+from app.database import db
+from app.models.product import Product
+from app.utils.cache import LRUCache
+import asyncio
+
+# Error code returned when change streams are unavailable (standalone server)
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+# Stored fields the product routes render; updates touching none of them keep cached entries valid
+RENDERED_FIELDS = [field.alias or name for name, field in Product.model_fields.items() if name != "id"]
+
+def _bson_size(value: Any) -> int:
+    return len(encode({"v": value}))
+
+# Single products keyed ("product", id), listing pages keyed ("list", category, search, skip, cursor, limit).
+# Entries get the long TTL only while the change stream is open to invalidate them; other
+# workers' writes would otherwise go unseen for that long.
+product_cache = LRUCache(
+    maxsize=PRODUCT_CACHE_SIZE,
+    ttl=PRODUCT_CACHE_UNWATCHED_TTL_SECONDS,
+    max_bytes=PRODUCT_CACHE_MAX_MB * 1024 * 1024,
+    sizeof=_bson_size
+)
+
+# Invalidation counters per scope; a read-through fill only lands if its scope's
+# counters are unchanged since the read began (see `fill_token` and `fill`)
+_generations: Dict[Hashable, int] = defaultdict(int)
+ALL_LISTS = ("list", "*")
+
+_watch_task: Optional[asyncio.Task] = None
+
+# Other in-process views of the catalog (e.g. the suggest index) that follow the change stream
+_change_listeners: List[Callable[[Dict], None]] = []
+
+def add_product_change_listener(listener: Callable[[Dict], None]) -> None:
+    _change_listeners.append(listener)
+
+def _scopes(key: Tuple) -> Tuple:
+    if key[0] == "list":
+        return (ALL_LISTS, ("list", key[1]))
+    return (key,)
+
+def fill_token(key: Tuple) -> Tuple[int, ...]:
+    """Take before the DB read that will fill `key`"""
+    return tuple(_generations[scope] for scope in (None, *_scopes(key)))
+
+def fill(key: Tuple, value: Any, token: Tuple[int, ...]) -> None:
+    """Cache a read-through result unless an invalidation raced with the read"""
+    if fill_token(key) == token:
+        product_cache.set(key, value)
+
+def clear_product_cache() -> None:
+    _generations[None] += 1
+    product_cache.clear()
+
+def invalidate_product(product_id: Optional[str] = None, categories: Optional[Iterable[str]] = None) -> None:
+    """Drop a product and the listing pages that could contain it.
+
+    With `categories` (every category the product is or was in) only those
+    categories' pages and the unfiltered pages go; without, every page does.
+    """
+    if product_id:
+        _generations[("product", product_id)] += 1
+        product_cache.invalidate(("product", product_id))
+
+    if categories is None:
+        _generations[ALL_LISTS] += 1
+        product_cache.invalidate_where(lambda key: key[0] == "list")
+        return
+
+    scopes = {None, *categories}
+    for category in scopes:
+        _generations[("list", category)] += 1
+    product_cache.invalidate_where(lambda key: key[0] == "list" and key[1] in scopes)
+
+def _watch_pipeline() -> List[Dict]:
+    # Skip updates that only touch bookkeeping the routes never render
+    touched = [{f"updateDescription.updatedFields.{field}": {"$exists": True}} for field in RENDERED_FIELDS]
+    touched.append({"updateDescription.removedFields": {"$in": RENDERED_FIELDS}})
+    return [{"$match": {"$or": [{"operationType": {"$ne": "update"}}, *touched]}}]
+
+def _affected_categories(change: Dict) -> Optional[List[str]]:
+    """Categories whose pages a change can affect, or None when that can't be told"""
+    operation = change["operationType"]
+    document = change.get("fullDocument")
+    if document is None and operation != "delete":
+        # Deleted again before the lookup
+        return None
+
+    categories = {document["category"]} if document else set()
+    description = change.get("updateDescription", {})
+    moved = (
+        operation in ("replace", "delete")
+        or "category" in description.get("updatedFields", {})
+        or "category" in description.get("removedFields", [])
+    )
+    if moved:
+        # Events carry no pre-image; the cached copy says where the product was listed
+        previous = product_cache.peek(("product", change["documentKey"]["_id"]))
+        if previous is None:
+            return None
+        categories.add(previous["category"])
+    return sorted(categories)
+
+def _apply_change(change: Dict) -> None:
+    product_id = change.get("documentKey", {}).get("_id")
+    if change["operationType"] in ("insert", "update", "replace", "delete"):
+        invalidate_product(product_id, _affected_categories(change))
+    else:
+        # drop, rename, invalidate: nothing cached can be trusted
+        clear_product_cache()
+
+    for listener in _change_listeners:
+        listener(change)
+
+async def _watch_product_changes() -> None:
+    resume_token = None
+    while True:
+        try:
+            async with db.db.products.watch(_watch_pipeline(), full_document="updateLookup", resume_after=resume_token) as stream:
+                product_cache.ttl = PRODUCT_CACHE_TTL_SECONDS
+                try:
+                    async for change in stream:
+                        _apply_change(change)
+                        resume_token = stream.resume_token
+                finally:
+                    product_cache.ttl = PRODUCT_CACHE_UNWATCHED_TTL_SECONDS
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                print("⚠️ Change streams unavailable, product cache relies on local invalidation and TTL")
+                return
+            print("❌ Product change stream error:", e)
+            resume_token = None
+            clear_product_cache()
+            await asyncio.sleep(5)
+        except PyMongoError as e:
+            # Changes may have been missed while disconnected
+            print("❌ Product change stream error:", e)
+            clear_product_cache()
+            await asyncio.sleep(5)
+
+def start_product_cache_watcher() -> None:
+    global _watch_task
+    if PRODUCT_CACHE_WATCH and _watch_task is None:
+        _watch_task = asyncio.create_task(_watch_product_changes())
+
+async def stop_product_cache_watcher() -> None:
+    global _watch_task
+    if _watch_task is not None:
+        _watch_task.cancel()
+        try:
+            await _watch_task
+        except asyncio.CancelledError:
+            pass
+        _watch_task = None
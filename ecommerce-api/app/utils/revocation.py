@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pymongo.errors import PyMongoError
+from app.config import REVOCATION_SYNC_SECONDS
+import asyncio
+import calendar
+import time
+
+# Re-read this much history on each sync so writers with slightly skewed clocks aren't missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+class RevocationSet:
+    """Revoked token ids held until their tokens would have expired anyway"""
+
+    def __init__(self):
+        # jti -> token expiry as a unix timestamp
+        self._expiry: Dict[str, float] = {}
+        self._next_purge = 0.0
+
+    def add(self, jti: str, expires_at: float) -> None:
+        self._expiry[jti] = expires_at
+
+    def __contains__(self, jti: str) -> bool:
+        now = time.time()
+        if now >= self._next_purge:
+            self._purge(now)
+        expires_at = self._expiry.get(jti)
+        return expires_at is not None and expires_at > now
+
+    def _purge(self, now: float) -> None:
+        self._expiry = {jti: expires_at for jti, expires_at in self._expiry.items() if expires_at > now}
+        self._next_purge = now + 60
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+revoked_tokens = RevocationSet()
+
+# Newest revoked_at seen so far; each sync only reads entries after it
+_synced_until: Optional[datetime] = None
+_last_sync = 0.0
+_sync_lock = asyncio.Lock()
+
+async def revoke_token(database, jti: str, expires_at: float) -> bool:
+    """Revoke locally at once; other workers pick it up on their next sync.
+
+    Returns False if the token was already revoked, which lets refresh-token
+    rotation reject a token replayed concurrently on another worker.
+    """
+    revoked_tokens.add(jti, expires_at)
+    result = await database.revoked_tokens.update_one(
+        {"_id": jti},
+        {"$setOnInsert": {"expires_at": datetime.utcfromtimestamp(expires_at), "revoked_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+async def sync_revocations(database, force: bool = False) -> None:
+    """Pull revocations from Mongo at most every REVOCATION_SYNC_SECONDS"""
+    global _synced_until, _last_sync
+    if not force and time.monotonic() - _last_sync < REVOCATION_SYNC_SECONDS:
+        return
+    if _sync_lock.locked():
+        # Another request is already syncing; don't queue the hot path behind it
+        return
+
+    async with _sync_lock:
+        query = {"revoked_at": {"$gt": _synced_until - SYNC_OVERLAP}} if _synced_until else {}
+        try:
+            async for entry in database.revoked_tokens.find(query).sort("revoked_at", 1):
+                revoked_tokens.add(entry["_id"], calendar.timegm(entry["expires_at"].utctimetuple()))
+                _synced_until = entry["revoked_at"]
+        except PyMongoError as e:
+            # Keep serving the last synced set; requests shouldn't fail on a revocation lookup
+            print("❌ Revocation sync failed:", e)
+        finally:
+            # Wait a full interval before retrying, so an outage isn't hit on every request
+            _last_sync = time.monotonic()
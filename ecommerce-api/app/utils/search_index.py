@@ -0,0 +1,198 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import re
+
+# Prefixes longer than this share the bucket of their first MAX_PREFIX characters
+MAX_PREFIX = 12
+# Upper bound on products scored by the typo-tolerant fallback
+FUZZY_CANDIDATES = 500
+SUGGEST_FIELDS = {"name": 1, "category": 1, "price": 1, "image_url": 1}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_EMPTY: Set[str] = frozenset()
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+def _prefixes(token: str) -> Iterable[str]:
+    return (token[:i] for i in range(1, min(len(token), MAX_PREFIX) + 1))
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SuggestIndex:
+    """In-memory prefix and trigram index over product names and categories"""
+
+    def __init__(self):
+        self._docs: Dict[str, Dict] = {}
+        self._doc_tokens: Dict[str, Tuple[Set[str], Set[str], str]] = {}
+        # Static tie-breaker: shorter names first
+        self._order: Dict[str, Tuple[int, str]] = {}
+        # Token prefixes from name and category, from name only, and prefixes of the whole name
+        self._prefixes: Dict[str, Set[str]] = {}
+        self._name_prefixes: Dict[str, Set[str]] = {}
+        self._phrase_prefixes: Dict[str, Set[str]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        # All ids in static order, rebuilt lazily after writes; used to rank broad tiers
+        self._ordered_ids: Optional[List[str]] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def build(self, products: Iterable[Dict]) -> None:
+        for buckets in (self._docs, self._doc_tokens, self._order, self._prefixes,
+                        self._name_prefixes, self._phrase_prefixes, self._trigrams):
+            buckets.clear()
+        for product in products:
+            self.upsert(product)
+        self.ready = True
+
+    def upsert(self, product: Dict) -> None:
+        product_id = product["_id"]
+        self.remove(product_id)
+
+        name_tokens = set(_tokens(product.get("name") or ""))
+        category_tokens = set(_tokens(product.get("category") or ""))
+        phrase = " ".join(_tokens(product.get("name") or ""))
+        self._docs[product_id] = {field: product.get(field) for field in ("_id", *SUGGEST_FIELDS)}
+        self._doc_tokens[product_id] = (name_tokens, category_tokens, phrase)
+        self._order[product_id] = (len(phrase), phrase)
+        self._ordered_ids = None
+        self._index(product_id, name_tokens, category_tokens, phrase, self._add)
+
+    def remove(self, product_id: str) -> None:
+        tokens = self._doc_tokens.pop(product_id, None)
+        if tokens is None:
+            return
+        self._docs.pop(product_id, None)
+        self._order.pop(product_id, None)
+        self._ordered_ids = None
+        self._index(product_id, *tokens, self._discard)
+
+    def _index(self, product_id: str, name_tokens: Set[str], category_tokens: Set[str], phrase: str, apply) -> None:
+        for token in name_tokens | category_tokens:
+            for prefix in _prefixes(token):
+                apply(self._prefixes, prefix, product_id)
+            for trigram in _trigrams(token):
+                apply(self._trigrams, trigram, product_id)
+        for token in name_tokens:
+            for prefix in _prefixes(token):
+                apply(self._name_prefixes, prefix, product_id)
+        for prefix in _prefixes(phrase):
+            apply(self._phrase_prefixes, prefix, product_id)
+
+    @staticmethod
+    def _add(buckets: Dict[str, Set[str]], key: str, product_id: str) -> None:
+        buckets.setdefault(key, set()).add(product_id)
+
+    @staticmethod
+    def _discard(buckets: Dict[str, Set[str]], key: str, product_id: str) -> None:
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.discard(product_id)
+            if not bucket:
+                del buckets[key]
+
+    def _matching(self, buckets: Dict[str, Set[str]], terms: List[str]) -> Set[str]:
+        # Intersect smallest buckets first so the working set stays small
+        # Callers only read the result, so a single bucket is returned without copying
+        matches = sorted((buckets.get(term[:MAX_PREFIX], _EMPTY) for term in terms), key=len)
+        return matches[0].intersection(*matches[1:]) if len(matches) > 1 else matches[0]
+
+    def _top(self, ids: Set[str], limit: int) -> List[str]:
+        if len(ids) * 20 < len(self._order):
+            return heapq.nsmallest(limit, ids, key=self._order.__getitem__)
+
+        # Broad tier: walk the global order, which finds `limit` members quickly
+        if self._ordered_ids is None:
+            self._ordered_ids = sorted(self._order, key=self._order.__getitem__)
+        ranked = []
+        for product_id in self._ordered_ids:
+            if product_id in ids:
+                ranked.append(product_id)
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def suggest(self, query: str, limit: int = 8) -> List[Dict]:
+        terms = _tokens(query)
+        if not terms:
+            return []
+
+        # Every query term must prefix-match some name or category token
+        candidates = self._matching(self._prefixes, terms)
+        if not candidates:
+            return self._fuzzy(terms, limit)
+
+        # Prefixes past MAX_PREFIX were truncated for lookup; confirm them here
+        long_terms = [term for term in terms if len(term) > MAX_PREFIX]
+        if long_terms:
+            candidates = {
+                product_id for product_id in candidates
+                if all(
+                    any(token.startswith(term) for token in self._doc_tokens[product_id][0] | self._doc_tokens[product_id][1])
+                    for term in long_terms
+                )
+            }
+
+        # Rank by tier using set intersections, then by the static order within a tier:
+        # whole-name prefix, then name-token matches, then category-only matches
+        phrase = " ".join(terms)
+        whole_name = candidates & self._phrase_prefixes.get(phrase[:MAX_PREFIX], _EMPTY)
+        if len(phrase) > MAX_PREFIX:
+            whole_name = {product_id for product_id in whole_name if self._doc_tokens[product_id][2].startswith(phrase)}
+        name_matches = (candidates & self._matching(self._name_prefixes, terms)) - whole_name
+        category_matches = candidates - whole_name - name_matches if len(whole_name) + len(name_matches) < limit else _EMPTY
+
+        results: List[Dict] = []
+        for tier in (whole_name, name_matches, category_matches):
+            remaining = limit - len(results)
+            if remaining <= 0:
+                break
+            results.extend(self._docs[product_id] for product_id in self._top(tier, remaining))
+        return results
+
+    def _fuzzy(self, terms: List[str], limit: int) -> List[Dict]:
+        """Fall back to trigram overlap so small typos still return something"""
+        wanted = set().union(*(_trigrams(term) for term in terms))
+        buckets = sorted((self._trigrams.get(trigram, _EMPTY) for trigram in wanted), key=len)
+
+        # Draw candidates from the rarest trigrams, then only score those against common ones
+        scores: Dict[str, int] = {}
+        for bucket in buckets:
+            for product_id in scores.keys() & bucket:
+                scores[product_id] += 1
+            for product_id in bucket:
+                if len(scores) >= FUZZY_CANDIDATES:
+                    break
+                scores.setdefault(product_id, 1)
+
+        threshold = max(2, len(wanted) // 2)
+        ranked = heapq.nlargest(
+            limit,
+            (product_id for product_id, score in scores.items() if score >= threshold),
+            key=lambda product_id: (scores[product_id], -self._order[product_id][0])
+        )
+        return [self._docs[product_id] for product_id in ranked]
+
+    def apply_change(self, change: Dict) -> None:
+        """Keep the index in step with product change-stream events"""
+        operation = change["operationType"]
+        product_id = change.get("documentKey", {}).get("_id")
+        if operation == "delete":
+            self.remove(product_id)
+        elif operation in ("insert", "update", "replace") and change.get("fullDocument"):
+            self.upsert(change["fullDocument"])
+
+suggest_index = SuggestIndex()
+_build_lock = asyncio.Lock()
+
+async def build_suggest_index(database) -> None:
+    async with _build_lock:
+        if suggest_index.ready:
+            return
+        products = await database.products.find({}, SUGGEST_FIELDS).to_list(None)
+        suggest_index.build(products)
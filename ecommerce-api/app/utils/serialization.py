@@ -0,0 +1,33 @@
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from typing import Any, Dict, List, Optional, Type
+from app.config import FAST_JSON_RESPONSES
+
+_adapters: Dict[Any, TypeAdapter] = {}
+
+def _adapter(model: Type[BaseModel], many: bool) -> TypeAdapter:
+    key = (model, many)
+    if key not in _adapters:
+        _adapters[key] = TypeAdapter(List[model] if many else model)
+    return _adapters[key]
+
+def dump_json(model: Type[BaseModel], data: Any, many: bool = False) -> bytes:
+    """Serialize Mongo documents through the model schema in one pydantic-core pass"""
+    # Same validation as response_model (aliases like _id mapped, undeclared fields such as
+    # hashed_password dropped, nested documents in schema order), but it stays in Rust
+    # instead of round-tripping through jsonable_encoder and json.dumps
+    adapter = _adapter(model, many)
+    return adapter.dump_json(adapter.validate_python(data), by_alias=True)
+
+def render(model: Type[BaseModel], data: Any, response: Optional[Response] = None, many: bool = False):
+    """Return data for FastAPI to validate, or a pre-serialized response in fast mode"""
+    if not FAST_JSON_RESPONSES:
+        return data
+
+    fast_response = Response(content=dump_json(model, data, many), media_type="application/json")
+    if response is not None:
+        # Carry over headers set on the injected response (cursors, cache validators)
+        for key, value in response.headers.items():
+            if key != "content-length":
+                fast_response.headers[key] = value
+    return fast_response
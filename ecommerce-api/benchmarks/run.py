@@ -0,0 +1,330 @@
+"""In-process benchmark for the e-commerce API.
+
+Drives the real `app.main:app` through an in-process ASGI client against
+mongomock-motor (default) or a local mongod (`--mongo-url`), seeded with a
+configurable catalog, user base and order history, and reports per-route
+throughput and p50/p95/p99 latency.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run --products 5000 --orders 20000 --output bench.json
+    python -m benchmarks.run --compare bench.json          # diff against a saved run
+
+Run from the ecommerce-api directory. Text search needs a real server, since
+mongomock does not implement $text.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+CATEGORIES = ["electronics", "books", "clothing", "home", "toys", "sports", "beauty", "garden"]
+WORDS = ["classic", "premium", "portable", "wireless", "organic", "vintage", "compact", "deluxe", "smart", "eco"]
+PASSWORD = "benchmark-password"
+
+def _configure_environment(args) -> None:
+    # Must run before anything under app/ is imported, since config is read at import time
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ["PRODUCT_CACHE_WATCH"] = "false"
+    os.environ["FAST_JSON_RESPONSES"] = "true" if args.fast_json else "false"
+    if args.no_cache:
+        os.environ["PRODUCT_CACHE_SIZE"] = "0"
+        os.environ["USER_CACHE_SIZE"] = "0"
+
+def _percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _connect(args):
+    from app.database import db
+
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from app.indexes import ensure_indexes
+
+        db.client = AsyncIOMotorClient(args.mongo_url)
+        await db.client.drop_database(args.db_name)
+        db.db = db.client[args.db_name]
+        await ensure_indexes(db.db)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        db.client = AsyncMongoMockClient()
+        db.db = db.client[args.db_name]
+    return db
+
+async def _seed(database, args) -> Dict:
+    from bson import ObjectId
+    from app.utils.auth_utils import get_pwd_context
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+
+    # Hash once; every seeded account shares the password
+    hashed_password = get_pwd_context().hash(PASSWORD)
+    users = [
+        {
+            "_id": str(ObjectId()),
+            "email": f"user{i}@bench.test",
+            "name": f"Bench User {i}",
+            "role": "admin" if i == 0 else "customer",
+            "hashed_password": hashed_password,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(args.users)
+    ]
+    await database.users.insert_many(users)
+
+    products = []
+    for i in range(args.products):
+        created_at = now - timedelta(minutes=i)
+        products.append({
+            "_id": str(ObjectId()),
+            "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} item {i}",
+            "description": "Seeded benchmark product",
+            "price": round(rng.uniform(1, 500), 2),
+            "category": rng.choice(CATEGORIES),
+            "stock": 1_000_000,
+            "image_url": None,
+            "created_at": created_at,
+            "updated_at": created_at,
+        })
+    await database.products.insert_many(products)
+
+    address = {
+        "address_line1": "1 Bench St", "city": "Benchville", "state": "BS",
+        "postal_code": "00000", "country": "Benchland"
+    }
+    for start in range(0, args.orders, 1000):
+        batch = []
+        for i in range(start, min(start + 1000, args.orders)):
+            items = [
+                {"product_id": p["_id"], "name": p["name"], "price": p["price"], "quantity": rng.randint(1, 3)}
+                for p in rng.sample(products, k=min(3, len(products)))
+            ]
+            created_at = now - timedelta(minutes=i)
+            batch.append({
+                "_id": str(ObjectId()),
+                "user_id": rng.choice(users)["_id"],
+                "items": items,
+                "total": sum(item["price"] * item["quantity"] for item in items),
+                "status": "pending",
+                "shipping_address": address,
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+        if batch:
+            await database.orders.insert_many(batch)
+
+    return {"users": users, "products": products}
+
+async def _measure(
+    name: str,
+    operation: Callable[[int], Awaitable[int]],
+    requests: int,
+    concurrency: int
+) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            status = await operation(i)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+    print(
+        f"{name:<16} {result['throughput_rps']:>9.1f} req/s  p50 {result['p50_ms']:>7.2f} ms  "
+        f"p95 {result['p95_ms']:>7.2f} ms  p99 {result['p99_ms']:>7.2f} ms  errors {errors}"
+    )
+    return result
+
+async def _run(args) -> Dict:
+    import httpx
+    from app.main import app
+    from app.utils.auth_utils import create_access_token, user_claims
+
+    database = (await _connect(args)).db
+    seeded = await _seed(database, args)
+    users, products = seeded["users"], seeded["products"]
+    rng = random.Random(args.seed)
+
+    def auth_headers(user: Dict) -> Dict[str, str]:
+        token = create_access_token(user_claims(user))
+        return {"Authorization": f"Bearer {token}"}
+
+    admin_headers = auth_headers(users[0])
+    customer_headers = [auth_headers(user) for user in users[1:]] or [admin_headers]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login(i: int) -> int:
+            user = users[i % len(users)]
+            response = await client.post("/auth/login", data={"username": user["email"], "password": PASSWORD})
+            return response.status_code
+
+        async def product_list(i: int) -> int:
+            params = {"limit": args.page_size}
+            if i % 2:
+                params["category"] = rng.choice(CATEGORIES)
+            response = await client.get("/products/", params=params, headers=customer_headers[i % len(customer_headers)])
+            return response.status_code
+
+        async def product_search(i: int) -> int:
+            response = await client.get(
+                "/products/", params={"search": rng.choice(WORDS), "limit": args.page_size},
+                headers=customer_headers[i % len(customer_headers)]
+            )
+            return response.status_code
+
+        async def cart_add(i: int) -> int:
+            response = await client.post(
+                "/cart/add", json={"product_id": rng.choice(products)["_id"], "quantity": 1},
+                headers=customer_headers[i % len(customer_headers)]
+            )
+            return response.status_code
+
+        async def checkout(i: int) -> int:
+            headers = customer_headers[i % len(customer_headers)]
+            # Fill the cart first; the checkout call itself is timed separately
+            for product in rng.sample(products, k=min(args.checkout_items, len(products))):
+                await client.post("/cart/add", json={"product_id": product["_id"], "quantity": 1}, headers=headers)
+            start = time.perf_counter()
+            response = await client.post("/orders/checkout", json={
+                "shipping_address": {
+                    "address_line1": "1 Bench St", "city": "Benchville", "state": "BS",
+                    "postal_code": "00000", "country": "Benchland"
+                }
+            }, headers=headers)
+            checkout_latencies.append(time.perf_counter() - start)
+            return response.status_code
+
+        async def admin_orders(i: int) -> int:
+            response = await client.get("/admin/orders", params={"limit": args.page_size}, headers=admin_headers)
+            return response.status_code
+
+        scenarios = {
+            "login": (login, max(1, args.requests // 10)),
+            "product_list": (product_list, args.requests),
+            "product_search": (product_search, args.requests),
+            "cart_add": (cart_add, args.requests),
+            "checkout": (checkout, max(1, args.requests // 5)),
+            "admin_orders": (admin_orders, args.requests),
+        }
+        if not args.mongo_url:
+            del scenarios["product_search"]
+            print("product_search skipped: mongomock has no $text support (use --mongo-url)")
+
+        results = {}
+        checkout_latencies: List[float] = []
+        for name, (operation, requests) in scenarios.items():
+            if args.only and name not in args.only:
+                continue
+            # Warm caches and connection pools before timing
+            for i in range(min(args.warmup, requests)):
+                await operation(i)
+            checkout_latencies.clear()
+            results[name] = await _measure(name, operation, requests, args.concurrency)
+
+            if name == "checkout" and checkout_latencies:
+                # Report the checkout call alone rather than cart filling plus checkout
+                results[name].update({
+                    "p50_ms": _percentile(checkout_latencies, 50) * 1000,
+                    "p95_ms": _percentile(checkout_latencies, 95) * 1000,
+                    "p99_ms": _percentile(checkout_latencies, 99) * 1000,
+                })
+
+    return results
+
+def _compare(results: Dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\nCompared with {baseline_path}:")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        throughput = (result["throughput_rps"] / before["throughput_rps"] - 1) * 100 if before["throughput_rps"] else 0
+        p99 = (result["p99_ms"] / before["p99_ms"] - 1) * 100 if before["p99_ms"] else 0
+        print(f"{name:<16} throughput {throughput:+6.1f}%  p99 {p99:+6.1f}%")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--checkout-items", type=int, default=5)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--fast-json", action="store_true", help="enable FAST_JSON_RESPONSES")
+    parser.add_argument("--no-cache", action="store_true", help="disable the user and product caches")
+    parser.add_argument("--only", nargs="+", help="run only these scenarios")
+    parser.add_argument("--mongo-url", help="benchmark against a real mongod instead of mongomock")
+    parser.add_argument("--db-name", default="ecommerce_benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="print deltas against a previous JSON result")
+    args = parser.parse_args()
+
+    _configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    results = asyncio.run(_run(args))
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "backend": "mongod" if args.mongo_url else "mongomock",
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    if args.compare:
+        _compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""Test suite for the e-commerce API.
+
+    pip install -r tests/requirements.txt
+    python -m pytest tests
+
+Run from the ecommerce-api directory. Most tests drive the app against
+mongomock-motor; those that need a real server (query plans) are skipped
+unless TEST_MONGODB_URL points at a disposable mongod.
+"""
+import os
+
+# Config is read at import time, so set it before anything under app/ is imported
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["PRODUCT_CACHE_WATCH"] = "false"
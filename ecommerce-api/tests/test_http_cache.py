@@ -0,0 +1,83 @@
+from datetime import datetime
+import asyncio
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from app.database import db
+from app.main import app
+from app.utils.auth_utils import create_access_token, user_claims
+from app.utils.product_cache import clear_product_cache
+
+NOW = datetime(2024, 5, 1, 12, 30, 15, 123000)
+
+USER = {
+    "_id": "665f1c2e9b1e8a3d4c5b6a01",
+    "email": "shopper@example.com",
+    "name": "Shopper",
+    "role": "customer",
+    "created_at": NOW,
+}
+PRODUCT = {
+    "_id": "665f1c2e9b1e8a3d4c5b6a71",
+    "name": "Wireless headphones",
+    "description": "Closed-back, 40 mm drivers",
+    "price": 129.99,
+    "category": "electronics",
+    "stock": 12,
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+CART = {
+    "_id": "665f1c2e9b1e8a3d4c5b6a91",
+    "user_id": USER["_id"],
+    "items": [{"product_id": PRODUCT["_id"], "name": PRODUCT["name"], "price": PRODUCT["price"], "quantity": 2}],
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+SHIPPING_ADDRESS = {
+    "address_line1": "1 Main St",
+    "city": "Springfield",
+    "state": "IL",
+    "postal_code": "62701",
+    "country": "US",
+}
+
+@pytest.fixture
+def database(monkeypatch):
+    # Patch the backing fields; reading the properties would connect to MONGODB_URL
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(db, "_client", client)
+    monkeypatch.setattr(db, "_db", client["ecommerce_test"])
+    clear_product_cache()
+    yield db.db
+    clear_product_cache()
+
+def test_checkout_changes_product_etag(database):
+    async def scenario():
+        await database.users.insert_one(USER)
+        await database.products.insert_one(PRODUCT)
+        await database.carts.insert_one(CART)
+        auth = {"Authorization": f"Bearer {create_access_token(user_claims(USER))}"}
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test", headers=auth
+        ) as client:
+            path = f"/products/{PRODUCT['_id']}"
+            first = await client.get(path)
+            assert first.status_code == 200
+            etag = first.headers["ETag"]
+            assert (await client.get(path, headers={"If-None-Match": etag})).status_code == 304
+
+            checkout = await client.post(
+                "/orders/checkout",
+                json={"shipping_address": SHIPPING_ADDRESS}
+            )
+            assert checkout.status_code == 200, checkout.text
+
+            # The stock changed, so a client holding the old ETag must get the new body
+            revalidated = await client.get(path, headers={"If-None-Match": etag})
+            assert revalidated.status_code == 200
+            assert revalidated.json()["stock"] == PRODUCT["stock"] - 2
+            assert revalidated.headers["ETag"] != etag
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from fastapi import HTTPException, Request, Response
+from mongomock_motor import AsyncMongoMockClient
+from app.database import db
+from app.utils import idempotency
+from app.utils.idempotency import REPLAYED_HEADER, idempotent
+
+USER_ID = "665f1c2e9b1e8a3d4c5b6a01"
+
+@pytest.fixture
+def database(monkeypatch):
+    # Patch the backing fields; reading the properties would connect to MONGODB_URL
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(db, "_client", client)
+    monkeypatch.setattr(db, "_db", client["ecommerce_test"])
+    idempotency._completed.clear()
+    yield db.db
+    idempotency._completed.clear()
+
+def _request(key: str, body: bytes = b'{"quantity": 1}') -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/orders/checkout",
+        "query_string": b"",
+        "headers": [(b"idempotency-key", key.encode())],
+    }
+    return Request(scope, receive)
+
+def test_concurrent_duplicates_run_once(database):
+    runs = []
+
+    async def operation():
+        runs.append(1)
+        # Still running when the duplicate arrives
+        await asyncio.sleep(0.05)
+        return {"order_id": "o1"}
+
+    async def scenario():
+        first, second = Response(), Response()
+        return await asyncio.gather(
+            idempotent(_request("k1"), first, USER_ID, operation),
+            idempotent(_request("k1"), second, USER_ID, operation),
+        ), first, second
+
+    (first_result, second_result), first, second = asyncio.run(scenario())
+    assert runs == [1]
+    assert first_result == second_result == {"order_id": "o1"}
+    assert REPLAYED_HEADER not in first.headers
+    assert second.headers[REPLAYED_HEADER] == "true"
+
+def test_key_reused_for_different_request_is_rejected(database):
+    async def operation():
+        return {"order_id": "o1"}
+
+    async def scenario():
+        await idempotent(_request("k2"), Response(), USER_ID, operation)
+        # Another worker has no LRU entry and finds the stored record instead
+        idempotency._completed.clear()
+        with pytest.raises(HTTPException) as rejected:
+            await idempotent(_request("k2", b'{"quantity": 2}'), Response(), USER_ID, operation)
+        return rejected.value
+
+    assert asyncio.run(scenario()).status_code == 422
+
+def test_failed_run_releases_key(database):
+    runs = []
+
+    async def failing():
+        runs.append("failed")
+        raise HTTPException(status_code=400, detail="Not enough stock")
+
+    async def succeeding():
+        runs.append("succeeded")
+        return {"order_id": "o2"}
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await idempotent(_request("k3"), Response(), USER_ID, failing)
+        assert await database.idempotency_keys.count_documents({}) == 0
+        return await idempotent(_request("k3"), Response(), USER_ID, succeeding)
+
+    assert asyncio.run(scenario()) == {"order_id": "o2"}
+    assert runs == ["failed", "succeeded"]
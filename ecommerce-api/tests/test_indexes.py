@@ -0,0 +1,28 @@
+import asyncio
+import os
+import pytest
+from app.indexes import QUERY_SHAPES, ensure_indexes, uses_collection_scan
+
+TEST_MONGODB_URL = os.getenv("TEST_MONGODB_URL")
+TEST_DB_NAME = "ecommerce_index_check"
+
+pytestmark = pytest.mark.skipif(not TEST_MONGODB_URL, reason="explain() needs a live mongod (set TEST_MONGODB_URL)")
+
+async def _plan_scans(collection_name, query, sort) -> bool:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(TEST_MONGODB_URL, serverSelectionTimeoutMS=5000)
+    try:
+        database = client[TEST_DB_NAME]
+        await ensure_indexes(database)
+        return await uses_collection_scan(database, collection_name, query, sort)
+    finally:
+        client.close()
+
+@pytest.mark.parametrize(
+    "collection_name, query, sort",
+    [shape[1:] for shape in QUERY_SHAPES],
+    ids=[shape[0] for shape in QUERY_SHAPES]
+)
+def test_query_shape_uses_an_index(collection_name, query, sort):
+    assert not asyncio.run(_plan_scans(collection_name, query, sort))
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+import asyncio
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+from app.utils.inventory import consume, give_back, reserve, shard_product_stock, sweep_expired
+
+USER_ID = "665f1c2e9b1e8a3d4c5b6a01"
+PRODUCT_ID = "665f1c2e9b1e8a3d4c5b6a71"
+SHARDS = 3
+
+@pytest.fixture
+def database():
+    database = AsyncMongoMockClient()["ecommerce_test"]
+    asyncio.run(database.products.insert_one({
+        "_id": PRODUCT_ID,
+        "name": "Wireless headphones",
+        "price": 129.99,
+        "category": "electronics",
+        "stock": 10,
+    }))
+    return database
+
+async def _available(database) -> int:
+    shards = await database.stock_shards.find({"product_id": PRODUCT_ID}).to_list(None)
+    return sum(shard["available"] for shard in shards)
+
+def test_shard_splits_stock_once(database):
+    async def scenario():
+        product = await shard_product_stock(database, PRODUCT_ID, SHARDS)
+        assert product["stock_shards"] == SHARDS
+        assert "sharding" not in product
+
+        shards = await database.stock_shards.find({"product_id": PRODUCT_ID}).to_list(None)
+        assert sorted(shard["available"] for shard in shards) == [3, 3, 4]
+        assert not any("pending" in shard for shard in shards)
+
+        with pytest.raises(HTTPException) as again:
+            await shard_product_stock(database, PRODUCT_ID, SHARDS)
+        assert again.value.status_code == 409
+
+    asyncio.run(scenario())
+
+def test_shard_leaves_a_live_attempt_alone(database):
+    async def scenario():
+        until = datetime.utcnow() + timedelta(seconds=60)
+        await database.products.update_one({"_id": PRODUCT_ID}, {"$set": {"sharding": {"attempt": "other", "until": until}}})
+        await database.stock_shards.insert_one({"_id": f"{PRODUCT_ID}:0", "product_id": PRODUCT_ID, "available": 4, "pending": "other"})
+
+        with pytest.raises(HTTPException) as busy:
+            await shard_product_stock(database, PRODUCT_ID, SHARDS)
+        assert busy.value.status_code == 409
+        assert await database.stock_shards.count_documents({"pending": "other"}) == 1
+
+    asyncio.run(scenario())
+
+def test_consume_uses_holds_and_buys_the_shortfall(database):
+    async def scenario():
+        await shard_product_stock(database, PRODUCT_ID, SHARDS)
+        await reserve(database, USER_ID, PRODUCT_ID, SHARDS, 2)
+        assert await _available(database) == 8
+
+        allocations = await consume(database, USER_ID, PRODUCT_ID, SHARDS, 3)
+        assert sum(allocation["quantity"] for allocation in allocations) == 3
+        assert await database.reservations.count_documents({}) == 0
+        assert await _available(database) == 7
+
+        # Checkout failed: the sold units go back
+        await give_back(database, PRODUCT_ID, allocations)
+        assert await _available(database) == 10
+
+    asyncio.run(scenario())
+
+def test_consume_returns_surplus_of_a_larger_hold(database):
+    async def scenario():
+        await shard_product_stock(database, PRODUCT_ID, SHARDS)
+        await reserve(database, USER_ID, PRODUCT_ID, SHARDS, 3)
+        allocations = await consume(database, USER_ID, PRODUCT_ID, SHARDS, 1)
+        assert sum(allocation["quantity"] for allocation in allocations) == 1
+        assert await _available(database) == 9
+
+    asyncio.run(scenario())
+
+def test_give_back_after_unshard_goes_to_product_stock(database):
+    async def scenario():
+        await give_back(database, PRODUCT_ID, [{"shard_id": f"{PRODUCT_ID}:0", "quantity": 2}])
+        return await database.products.find_one({"_id": PRODUCT_ID})
+
+    assert asyncio.run(scenario())["stock"] == 12
+
+def test_sweep_returns_expired_holds(database):
+    async def scenario():
+        await shard_product_stock(database, PRODUCT_ID, SHARDS)
+        await reserve(database, USER_ID, PRODUCT_ID, SHARDS, 4)
+        await reserve(database, "665f1c2e9b1e8a3d4c5b6a02", PRODUCT_ID, SHARDS, 1)
+        await database.reservations.update_one(
+            {"user_id": USER_ID}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+
+        assert await sweep_expired(database) == 1
+        assert await database.reservations.count_documents({}) == 1
+        assert await _available(database) == 9
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+import asyncio
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from app.utils import outbox
+from app.utils.outbox import DONE, PENDING, PROCESSING, apply_once, drain, enqueue, once
+
+EVENT = "test.event"
+
+@pytest.fixture
+def database(monkeypatch):
+    # Only this test's handlers, and no embedded-event sources to relay
+    monkeypatch.setattr(outbox, "_handlers", {})
+    monkeypatch.setattr(outbox, "_event_sources", [])
+    return AsyncMongoMockClient()["ecommerce_test"]
+
+async def _make_due(database):
+    await database.outbox.update_many({}, {"$set": {"available_at": datetime.utcnow() - timedelta(seconds=1)}})
+
+def test_claim_leases_events(database):
+    async def scenario():
+        await enqueue(database, EVENT, {"n": 1})
+        await enqueue(database, EVENT, {"n": 2})
+
+        batch = await outbox._claim_batch(database)
+        assert len(batch) == 2
+        assert {event["status"] for event in batch} == {PROCESSING}
+        # Leased events aren't due again until the lease lapses
+        assert await outbox._claim_batch(database) == []
+
+        await _make_due(database)
+        reclaimed = await outbox._claim_batch(database)
+        assert len(reclaimed) == 2
+        assert reclaimed[0]["lease"] != batch[0]["lease"]
+
+        # The first worker's lease is gone, so its completion doesn't land
+        await outbox._process(database, batch[0])
+        event = await database.outbox.find_one({"_id": batch[0]["_id"]})
+        assert event["status"] == PROCESSING
+
+    asyncio.run(scenario())
+
+def test_failed_handler_is_retried_without_rerunning_others(database):
+    calls = []
+
+    @outbox.handles(EVENT)
+    async def record(database, payload, event_id):
+        calls.append("record")
+
+    @outbox.handles(EVENT)
+    async def flaky(database, payload, event_id):
+        calls.append("flaky")
+        if calls.count("flaky") == 1:
+            raise RuntimeError("temporary failure")
+
+    async def scenario():
+        await enqueue(database, EVENT, {})
+        assert await drain(database) == 1
+        event = await database.outbox.find_one({})
+        assert event["status"] == PENDING
+        assert event["attempts"] == 1
+        assert "temporary failure" in event["last_error"]
+        assert "lease" not in event
+
+        await _make_due(database)
+        assert await drain(database) == 1
+        return await database.outbox.find_one({})
+
+    event = asyncio.run(scenario())
+    assert event["status"] == DONE
+    assert calls == ["record", "flaky", "flaky"]
+
+def test_apply_once_skips_repeated_events(database):
+    def count(event_id):
+        return once("electronics", {"$inc": {"orders": 1}}, event_id)
+
+    async def scenario():
+        await apply_once(database.rollups, [count("e1")])
+        # Redelivery of e1, once for an existing and once for a new document
+        await apply_once(database.rollups, [count("e1"), once("books", {"$inc": {"orders": 1}}, "e1")])
+        await apply_once(database.rollups, [count("e2")])
+        return {row["_id"]: row for row in await database.rollups.find({}).to_list(None)}
+
+    rows = asyncio.run(scenario())
+    assert rows["electronics"]["orders"] == 2
+    assert rows["electronics"]["applied"] == ["e1", "e2"]
+    assert rows["books"]["orders"] == 1
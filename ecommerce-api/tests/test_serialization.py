@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import List
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI
+from app.models.cart import Cart
+from app.models.order import Order
+from app.models.product import Product
+from app.utils import serialization
+
+NOW = datetime(2024, 5, 1, 12, 30, 15, 123000)
+
+PRODUCT = {
+    "_id": "665f1c2e9b1e8a3d4c5b6a71",
+    "name": "Wireless headphones — “studio” edition",
+    "description": "Closed-back, 40 mm drivers",
+    "price": 129.99,
+    "category": "electronics",
+    "stock": 12,
+    "image_url": "/uploads/abc.jpg",
+    "image_variants": {"thumbnail": "/uploads/abc_thumbnail.jpg", "thumbnail_webp": "/uploads/abc_thumbnail.webp"},
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+# Fields the model doesn't declare must be dropped on both paths
+LEGACY_PRODUCT = {**PRODUCT, "_id": "665f1c2e9b1e8a3d4c5b6a72", "image_variants": None, "recent_checkouts": ["x"]}
+SHARDED_PRODUCT = {**PRODUCT, "_id": "665f1c2e9b1e8a3d4c5b6a73", "stock": 0, "stock_shards": 8}
+
+ORDER = {
+    "_id": "665f1c2e9b1e8a3d4c5b6a80",
+    "user_id": "665f1c2e9b1e8a3d4c5b6a90",
+    "items": [
+        {"product_id": PRODUCT["_id"], "name": PRODUCT["name"], "price": 129.99, "quantity": 2},
+        {"product_id": "665f1c2e9b1e8a3d4c5b6a74", "name": "Cable", "price": 0.1, "quantity": 3},
+    ],
+    "total": 260.28,
+    "status": "shipped",
+    "shipping_address": {
+        "address_line1": "1 Main St",
+        "address_line2": None,
+        "city": "Zürich",
+        "state": "ZH",
+        "postal_code": "8001",
+        "country": "CH",
+    },
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+
+# Nested documents written by other tools: keys out of schema order, plus undeclared ones
+REORDERED_ORDER = {
+    **ORDER,
+    "_id": "665f1c2e9b1e8a3d4c5b6a81",
+    "items": [{"quantity": 1, "price": 0.1, "name": "Cable", "product_id": "665f1c2e9b1e8a3d4c5b6a74", "sku": "C-1"}],
+    "shipping_address": {**dict(reversed(list(ORDER["shipping_address"].items()))), "phone": "+41 44 000 00 00"},
+}
+
+CART = {
+    "_id": "665f1c2e9b1e8a3d4c5b6a95",
+    "user_id": ORDER["user_id"],
+    "items": [{"product_id": PRODUCT["_id"], "quantity": 1, "name": PRODUCT["name"], "price": 129.99}],
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+
+# Prices and totals stay within the range where Python's float repr and pydantic-core's
+# agree; they differ only in exponent notation (>= 1e16 or < 1e-4)
+CASES = [
+    ("product", Product, PRODUCT, False),
+    ("legacy-product", Product, LEGACY_PRODUCT, False),
+    ("sharded-product", Product, SHARDED_PRODUCT, False),
+    ("product-list", Product, [PRODUCT, LEGACY_PRODUCT, SHARDED_PRODUCT], True),
+    ("order", Order, ORDER, False),
+    ("reordered-order", Order, REORDERED_ORDER, False),
+    ("order-list", Order, [ORDER, REORDERED_ORDER], True),
+    ("cart", Cart, CART, False),
+    ("empty-cart", Cart, {**CART, "items": []}, False),
+]
+
+def _default_response(model, data, many: bool) -> bytes:
+    """Bytes FastAPI produces for `data` through response_model validation and JSONResponse"""
+    app = FastAPI()
+
+    @app.get("/", response_model=List[model] if many else model)
+    def endpoint():
+        return data
+
+    async def fetch() -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/")
+
+    response = asyncio.run(fetch())
+    assert response.status_code == 200
+    return response.content
+
+@pytest.mark.parametrize("model, data, many", [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+def test_fast_path_matches_default_serializer(monkeypatch, model, data, many):
+    monkeypatch.setattr(serialization, "FAST_JSON_RESPONSES", True)
+    fast = serialization.render(model, data, many=many)
+    assert fast.body == _default_response(model, data, many)